@@ -1,25 +1,126 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import pandas as pd
 import numpy as np
 import os
+import contextlib
+import copy
 import logging
+import tempfile
+import threading
+import time
 from datetime import datetime
 
 # Import models
-from src.models.demand_forecasting.demand_model import DemandForecastingModel
+from src.models.demand_forecasting.demand_model import (DemandForecastingModel, normalize_quantiles,
+                                                        quantile_column)
+from src.models.demand_forecasting.model_registry import SegmentedDemandModel
 from src.models.sustainability.sustainability_model import SustainabilityModel
+from src.data.ingestion import (SALES_SCHEMA, SUSTAINABILITY_SCHEMA, check_required,
+                                compact_frame, ingest_csv, iter_csv_chunks, validate_frame)
+from src.data.demand_cube import DemandCube
+from src.data.persistence import load_state, publish_lock, publish_state, read_manifest
+from src.data.sales_store import SalesStore
+from src.data.snapshots import Snapshot, SnapshotHolder, StateConflict, components_of
+from src.services.forecast_cache import ForecastCache
+from src.services.training_jobs import TrainingScheduler
+from src.utils.metrics import CONTENT_TYPE, REGISTRY, timed, timed_iter
+from src.utils.profiling import SamplingProfiler
+from src.utils.serialization import (FORMAT_MIMETYPES, RESPONSE_FORMATS, iter_columnar_json,
+                                     iter_ndjson)
+
+class NumpyJSONProvider(DefaultJSONProvider):
+    """JSON provider that also serializes NumPy scalars and arrays"""
+    
+    @staticmethod
+    def default(o):
+        # Compact dtypes from ingestion surface as NumPy scalars in aggregates
+        if isinstance(o, np.generic):
+            return o.item()
+        if isinstance(o, np.ndarray):
+            return o.tolist()
+        return DefaultJSONProvider.default(o)
 
 app = Flask(__name__)
+app.json = NumpyJSONProvider(app)
 CORS(app)
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize models
-demand_model = DemandForecastingModel()
-sustainability_model = SustainabilityModel()
+def create_demand_model(snapshot):
+    """Demand model configured from the environment
+    
+    DEMAND_SEGMENT_BY=category|volume trains one model per product segment
+    (DEMAND_SEGMENTS volume clusters) across DEMAND_TRAIN_WORKERS processes;
+    otherwise a single model uses that many cores for its forest.
+    """
+    workers = int(os.environ.get('DEMAND_TRAIN_WORKERS', 0)) or None
+    segment_by = os.environ.get('DEMAND_SEGMENT_BY')
+    if segment_by:
+        categories = None
+        if segment_by == 'category' and 'category' in snapshot.sustainability_df.columns:
+            categories = product_categories(snapshot)
+        return SegmentedDemandModel(
+            segment_by=segment_by,
+            n_segments=int(os.environ.get('DEMAND_SEGMENTS', 4)),
+            categories=categories,
+            max_workers=workers
+        )
+    return DemandForecastingModel(n_jobs=workers)
+
+def product_categories(snapshot):
+    """product_id -> category mapping from the sustainability data"""
+    sustainability_df = snapshot.sustainability_df
+    return sustainability_df.drop_duplicates('product_id').set_index('product_id')['category']
+
+# Initialize services
+forecast_cache = ForecastCache()
+training_scheduler = TrainingScheduler(max_workers=int(os.environ.get('TRAINING_WORKERS', 2)))
+# Uploads are ingested one at a time, in arrival order, off the request path
+ingestion_scheduler = TrainingScheduler(max_workers=1)
+# Serializes demand training jobs so a slower job never swaps in over a newer model
+training_lock = threading.Lock()
+# Models, data and indexes are published here and shared by every worker process
+STATE_DIR = os.environ.get('STATE_DIR')
+# Published file of each state component this worker is serving
+loaded_components = {}
+sync_lock = threading.Lock()
+# Times a job rebuilds its update when other workers keep publishing first
+PUBLISH_ATTEMPTS = 3
+# Off until started through /api/profiler/start
+profiler = SamplingProfiler()
+
+# Request latency is measured from before state sync to the end of the handler;
+# streamed bodies are timed separately as their serialize stage
+REQUEST_SECONDS = REGISTRY.histogram(
+    'http_request_duration_seconds', 'Request handling time by endpoint', ('endpoint', 'method', 'status'))
+REQUEST_EXCEPTIONS = REGISTRY.counter(
+    'http_request_exceptions_total', 'Unhandled errors returned as 500 by endpoint', ('endpoint', 'exception'))
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=request_endpoint(),
+                                method=request.method, status=response.status_code)
+    return response
+
+def request_endpoint():
+    """Route pattern of the request, so per-product paths share one series"""
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+def error_response(e):
+    """Log and count an unexpected error, returning the generic 500 body"""
+    logger.exception("%s %s failed", request.method, request.path)
+    REQUEST_EXCEPTIONS.inc(endpoint=request_endpoint(), exception=type(e).__name__)
+    return jsonify({'status': 'error', 'message': str(e)}), 500
 
 # Sample data for demo
 def create_sample_data():
@@ -30,34 +131,150 @@ def create_sample_data():
     products = [f'PROD{i:03d}' for i in range(1, 21)]
     categories = ['Electronics', 'Clothing', 'Home', 'Sports', 'Books']
     
-    # Generate sales data
-    sales_data = []
-    for i in range(100):
-        sales_data.append({
-            'product_id': np.random.choice(products),
-            'date': pd.date_range('2024-01-01', periods=100)[i],
-            'quantity': np.random.poisson(10) + 1,
-            'price': np.random.uniform(10, 100)
-        })
+    # Generate sales data, one order per day
+    n_sales = 100
+    sales_data = pd.DataFrame({
+        'product_id': np.random.choice(products, n_sales),
+        'date': pd.date_range('2024-01-01', periods=n_sales),
+        'quantity': np.random.poisson(10, n_sales) + 1,
+        'price': np.random.uniform(10, 100, n_sales)
+    })
     
     # Generate sustainability data
-    sustainability_data = []
-    for product in products:
-        sustainability_data.append({
-            'product_id': product,
-            'category': np.random.choice(categories),
-            'carbon_footprint': np.random.uniform(0.5, 5.0),
-            'recyclability': np.random.uniform(0, 100),
-            'packaging_score': np.random.uniform(0, 100),
-            'sourcing_score': np.random.uniform(0, 100),
-            'durability': np.random.uniform(1, 10),
-            'end_of_life_score': np.random.uniform(0, 100)
-        })
+    n_products = len(products)
+    sustainability_data = pd.DataFrame({
+        'product_id': products,
+        'category': np.random.choice(categories, n_products),
+        'carbon_footprint': np.random.uniform(0.5, 5.0, n_products),
+        'recyclability': np.random.uniform(0, 100, n_products),
+        'packaging_score': np.random.uniform(0, 100, n_products),
+        'sourcing_score': np.random.uniform(0, 100, n_products),
+        'durability': np.random.uniform(1, 10, n_products),
+        'end_of_life_score': np.random.uniform(0, 100, n_products)
+    })
     
-    return pd.DataFrame(sales_data), pd.DataFrame(sustainability_data)
+    return sales_data, sustainability_data
+
+# Served datasets and models live in immutable snapshots; with STATE_DIR set they
+# are also published as memory-mappable files that every worker maps before a request
+def commit_state(base, **changes):
+    """Swap in (and publish) a snapshot with the given objects replaced; returns it
+    
+    base is the snapshot the changes were built from. If another job or
+    worker replaced one of the changed components since, StateConflict is
+    raised and nothing is swapped in or published.
+    """
+    if not changes:
+        return base
+    if not STATE_DIR:
+        return snapshots.swap(base=base, **changes)
+    
+    # The publish lock is always taken before sync_lock, so the two never deadlock
+    with publish_lock(STATE_DIR), sync_lock:
+        components = components_of(base, changes)
+        manifest = publish_state(STATE_DIR, components, expected=base.sources)
+        for name in components:
+            loaded_components[name] = manifest['components'][name]
+        # Take along whatever other workers published meanwhile
+        manifest, published = load_state(STATE_DIR, loaded=loaded_components)
+        loaded_components.update(manifest['components'])
+        return serve_published(manifest['version'], {**changes, **published}, published)
+
+def commit_rebuilt(build, attempts=PUBLISH_ATTEMPTS):
+    """Commit the changes build(snapshot) makes to the latest state; returns the new snapshot
+    
+    When another worker published one of the changed components first, the
+    changes are rebuilt on top of its state instead of overwriting it. The
+    last attempt builds while holding the publish lock, so it cannot lose.
+    """
+    for attempt in range(1, attempts + 1):
+        exclusive = STATE_DIR and attempt == attempts
+        with publish_lock(STATE_DIR) if exclusive else contextlib.nullcontext():
+            load_published()
+            base = snapshots.current
+            try:
+                return commit_state(base, **build(base))
+            except StateConflict as e:
+                if attempt == attempts:
+                    raise
+                logger.warning("%s; rebuilding on the latest state (attempt %d of %d)",
+                               e, attempt + 1, attempts)
+
+def serve_published(version, state, published):
+    """Swap in a snapshot of state, published holding the objects loaded from other workers"""
+    if 'sales_store' in published:
+        # Data versions are assigned per process, so cached forecasts cannot be matched
+        forecast_cache.clear()
+    return snapshots.swap(version, sources=dict(loaded_components), **state)
+
+def load_published():
+    """Serve state published by other workers since it was last loaded"""
+    if not STATE_DIR:
+        return
+    manifest = read_manifest(STATE_DIR)
+    if manifest is None or manifest['components'] == loaded_components:
+        return
+    with sync_lock:
+        try:
+            manifest, state = load_state(STATE_DIR, loaded=loaded_components)
+        except FileNotFoundError:
+            # Superseded and pruned while loading; the next call loads the newer version
+            logger.warning("State version changed while loading; retrying on next request")
+            return
+        loaded_components.update(manifest['components'])
+        serve_published(manifest['version'], state, state)
+
+@app.before_request
+def sync_state():
+    """Pick up state published by other workers since the last request"""
+    load_published()
+
+def initial_snapshot():
+    """Snapshot of the published state, with sample data for anything unpublished"""
+    manifest, state = load_state(STATE_DIR) if STATE_DIR else (None, {})
+    if manifest is not None:
+        loaded_components.update(manifest['components'])
+    
+    if 'sales_store' not in state or 'sustainability_df' not in state:
+        sales_df, sustainability_df = create_sample_data()
+        if 'sales_store' not in state:
+            # Sales are served from a (product_id, date)-sorted store with a per-product index
+            state.update(sales_store=SalesStore(sales_df), demand_cube=DemandCube.from_frame(sales_df))
+        if 'sustainability_df' not in state:
+            sustainability_model = SustainabilityModel()
+            sustainability_model.fit(sustainability_df)
+            state.update(sustainability_model=sustainability_model, sustainability_df=sustainability_df)
+    state.setdefault('demand_model', DemandForecastingModel())
+    
+    return Snapshot(manifest['version'] if manifest is not None else 0, dict(loaded_components), **state)
+
+snapshots = SnapshotHolder(initial_snapshot())
+
+# Large results can be returned as records (default), columnar JSON or streamed NDJSON
+def negotiate_format():
+    """Response format from ?format= or else the Accept header"""
+    requested = request.args.get('format')
+    if requested is None:
+        best = request.accept_mimetypes.best_match(list(FORMAT_MIMETYPES), default='application/json')
+        return FORMAT_MIMETYPES[best]
+    if requested not in RESPONSE_FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(RESPONSE_FORMATS)}")
+    return requested
 
-# Load sample data
-sales_df, sustainability_df = create_sample_data()
+def frame_response(frame, columns, key, response_format, **meta):
+    """Success response carrying frame under key; NDJSON sends meta as X- headers"""
+    if response_format == 'records':
+        with timed('api', 'serialize', rows=len(frame)):
+            return jsonify({'status': 'success', key: frame[columns].to_dict('records'), **meta})
+    if response_format == 'columnar':
+        body = iter_columnar_json(frame, columns, key, {'status': 'success', **meta})
+        return Response(timed_iter(body, 'api', 'serialize', rows=len(frame)), mimetype='application/json')
+    
+    headers = {'X-' + name.replace('_', '-').title(): str(value)
+               for name, value in meta.items() if value is not None}
+    body = iter_ndjson(frame, columns)
+    return Response(timed_iter(body, 'api', 'serialize', rows=len(frame)),
+                    mimetype='application/x-ndjson', headers=headers)
 
 @app.route('/')
 def home():
@@ -67,141 +284,340 @@ def home():
         'endpoints': {
             'demand_forecast': '/api/demand/forecast',
             'demand_analysis': '/api/demand/analyze',
+            'demand_aggregate': '/api/demand/aggregate',
             'sustainability_score': '/api/sustainability/score',
-            'sustainability_analysis': '/api/sustainability/analyze'
+            'sustainability_analysis': '/api/sustainability/analyze',
+            'metrics': '/metrics'
         }
     })
 
+# Background training: a new model is fitted off the request path and swapped in when ready
+def run_demand_training(report):
+    """Train a fresh demand model on the current sales data
+    
+    Fails instead of publishing if another worker published a model while
+    this one trained, so an older model never replaces a newer one.
+    """
+    with training_lock:
+        load_published()
+        base = snapshots.current
+        model = create_demand_model(base)
+        result = model.train(base.sales_store, progress=report)
+        record_lineage(model, base.sales_store.generation)
+        snapshot = commit_state(base, demand_model=model)
+    return {**result, 'snapshot_version': snapshot.version}
+
+# A model records the store generation it was trained on and the uploads appended
+# since, so an update queued before a full train does not add its rows twice
+def record_lineage(model, trained, appended=frozenset()):
+    model.sales_lineage = (trained, frozenset(appended))
+
+def includes_upload(model, generation):
+    """Whether the sales store of the given generation is already in model's training set"""
+    trained, appended = getattr(model, 'sales_lineage', (None, frozenset()))
+    return (trained is not None and generation <= trained) or generation in appended
+
+def run_demand_update(report, new_rows, generation):
+    """Extend a copy of the served demand model with the sales rows appended as store generation"""
+    result = None
+    
+    def build(snapshot):
+        nonlocal result
+        result = None
+        if includes_upload(snapshot.demand_model, generation):
+            result = {'status': 'skipped', 'reason': 'already trained on these rows', 'new_samples': 0}
+            return {}
+        
+        if snapshot.demand_model.is_trained:
+            model = copy.deepcopy(snapshot.demand_model)
+            try:
+                report(0.1, 'update')
+                result = model.update(new_rows)
+                trained, appended = getattr(model, 'sales_lineage', (None, frozenset()))
+                record_lineage(model, trained, appended | {generation})
+            except ValueError as e:
+                # Backfilled or pre-state history cannot be appended incrementally
+                logger.warning("Incremental update failed (%s); retraining on full history", e)
+        
+        if result is None:
+            model = create_demand_model(snapshot)
+            result = model.train(snapshot.sales_store, progress=report)
+            record_lineage(model, snapshot.sales_store.generation)
+        return {'demand_model': model}
+    
+    with training_lock:
+        # A model published meanwhile by another worker is extended instead of replaced
+        snapshot = commit_rebuilt(build)
+    return {**result, 'snapshot_version': snapshot.version}
+
 # Demand Forecasting Endpoints
 @app.route('/api/demand/train', methods=['POST'])
 def train_demand_model():
     try:
         # Train with sample data or uploaded data
-        result = demand_model.train(sales_df)
+        job = training_scheduler.submit('demand_train', run_demand_training)
         return jsonify({
-            'status': 'success',
-            'message': 'Demand forecasting model trained successfully',
-            'details': result
-        })
+            'status': 'accepted',
+            'message': 'Demand forecasting model training started',
+            'job': job
+        }), 202
     except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        return error_response(e)
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    kind = request.args.get('kind')
+    jobs = training_scheduler.jobs(kind) + ingestion_scheduler.jobs(kind)
+    return jsonify({
+        'status': 'success',
+        'jobs': sorted(jobs, key=lambda job: job['submitted_at'], reverse=True)
+    })
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = training_scheduler.get(job_id) or ingestion_scheduler.get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Job not found'}), 404
+    return jsonify({
+        'status': 'success',
+        'job': job
+    })
 
 @app.route('/api/demand/forecast', methods=['POST'])
 def forecast_demand():
     try:
         data = request.json
-        days = data.get('days', 30)
+        days = int(data.get('days', 30))
+        if days < 1:
+            return jsonify({'status': 'error', 'message': 'days must be at least 1'}), 400
+        # e.g. [0.1, 0.5, 0.9] or "0.1,0.5,0.9" adds p10, p50 and p90 columns from the forest's trees
+        quantiles = normalize_quantiles(data.get('quantiles', request.args.get('quantiles')))
+        response_format = negotiate_format()
         
-        # Train model if not already trained
-        if not demand_model.is_trained:
-            demand_model.train(sales_df)
+        # Serve from the last good model; a cold worker starts training instead of blocking
+        snapshot = snapshots.current
+        if not snapshot.demand_model.is_trained:
+            job = training_scheduler.submit_once('demand_train', run_demand_training)
+            return jsonify({
+                'status': 'training',
+                'message': 'Demand model is not trained yet; retry when the job completes',
+                'job': job,
+                'snapshot_version': snapshot.version
+            }), 503
         
-        predictions = demand_model.predict(sales_df, days=days)
+        predictions = forecast_cache.forecast(snapshot.demand_model, snapshot.sales_store, days, quantiles)
+        columns = ['product_id', 'date', 'predicted_quantity'] + [quantile_column(q) for q in quantiles]
         
+        return frame_response(predictions, columns, 'predictions', response_format, forecast_days=days,
+                              quantiles=list(quantiles) or None,
+                              snapshot_version=snapshot.version)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/demand/analyze', methods=['GET'])
+def analyze_demand():
+    try:
+        snapshot = snapshots.current
+        analysis = snapshot.demand_model.analyze_demand(snapshot.demand_cube)
         return jsonify({
             'status': 'success',
-            'predictions': predictions.to_dict('records'),
-            'forecast_days': days
+            'analysis': analysis,
+            'snapshot_version': snapshot.version
         })
     except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        return error_response(e)
 
-@app.route('/api/demand/analyze', methods=['GET'])
-def analyze_demand():
+@app.route('/api/demand/aggregate', methods=['GET'])
+def aggregate_demand():
     try:
-        analysis = demand_model.analyze_demand(sales_df)
+        snapshot = snapshots.current
+        granularity = request.args.get('granularity', 'day')
+        categories = None
+        if granularity == 'category' and 'category' in snapshot.sustainability_df.columns:
+            categories = product_categories(snapshot)
+        
+        totals = snapshot.demand_cube.aggregate(
+            granularity,
+            start=request.args.get('start'),
+            end=request.args.get('end'),
+            product_id=request.args.get('product_id'),
+            categories=categories
+        )
         return jsonify({
             'status': 'success',
-            'analysis': analysis
+            'granularity': granularity,
+            'totals': totals,
+            'snapshot_version': snapshot.version
         })
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        return error_response(e)
 
 @app.route('/api/demand/product/<product_id>', methods=['GET'])
 def get_product_demand(product_id):
     try:
-        product_data = sales_df[sales_df['product_id'] == product_id]
-        if product_data.empty:
+        snapshot = snapshots.current
+        stats = snapshot.sales_store.stats(product_id)
+        if stats is None:
             return jsonify({'status': 'error', 'message': 'Product not found'}), 404
         
-        stats = {
-            'product_id': product_id,
-            'total_sales': product_data['quantity'].sum(),
-            'avg_sales': product_data['quantity'].mean(),
-            'order_count': len(product_data),
-            'date_range': {
-                'start': product_data['date'].min().strftime('%Y-%m-%d'),
-                'end': product_data['date'].max().strftime('%Y-%m-%d')
-            }
-        }
-        
         return jsonify({
             'status': 'success',
-            'product_stats': stats
+            'product_stats': stats,
+            'snapshot_version': snapshot.version
         })
     except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        return error_response(e)
 
 # Sustainability Endpoints
 @app.route('/api/sustainability/score', methods=['POST'])
 def calculate_sustainability_score():
     try:
+        snapshot = snapshots.current
         data = request.json
         product_ids = data.get('product_ids', [])
+        response_format = negotiate_format()
         
-        if product_ids:
-            filtered_data = sustainability_df[sustainability_df['product_id'].isin(product_ids)]
+        # Scores are materialized against the fitted reference, so this is a lookup
+        scored_data = snapshot.sustainability_model.lookup_scores(product_ids or None)
+        
+        return frame_response(scored_data, ['product_id', 'sustainability_score', 'sustainability_level'],
+                              'scores', response_format, snapshot_version=snapshot.version)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/sustainability/score/bulk', methods=['POST'])
+def bulk_score_sustainability():
+    """Score posted sustainability records (JSON or CSV) and stream NDJSON results"""
+    try:
+        # The whole stream is scored by the model of one snapshot
+        snapshot = snapshots.current
+        model = snapshot.sustainability_model
+        chunk_rows = int(request.args.get('chunk_rows', 50000))
+        if 'file' in request.files:
+            chunks = iter_csv_chunks(request.files['file'].stream, SUSTAINABILITY_SCHEMA, chunk_rows)
+        elif request.mimetype == 'text/csv':
+            chunks = iter_csv_chunks(request.stream, SUSTAINABILITY_SCHEMA, chunk_rows)
         else:
-            filtered_data = sustainability_df
+            data = request.get_json()
+            records = data.get('records', []) if isinstance(data, dict) else data
+            chunks = iter_record_chunks(records, chunk_rows)
         
-        scored_data = sustainability_model.calculate_sustainability_score(filtered_data)
+        # Score the first chunk up front so bad input fails with a status code, not a cut stream
+        first = next(chunks, None)
+        if first is None:
+            return jsonify({'status': 'error', 'message': 'No records provided'}), 400
+        first = model.score_batch(first)
         
-        return jsonify({
-            'status': 'success',
-            'scores': scored_data[['product_id', 'sustainability_score', 'sustainability_level']].to_dict('records')
-        })
+        def generate():
+            columns = ['product_id', 'sustainability_score', 'sustainability_level']
+            yield from iter_ndjson(first, columns, chunk_rows)
+            for chunk in chunks:
+                yield from iter_ndjson(model.score_batch(chunk), columns, chunk_rows)
+        
+        response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        response.headers['X-Snapshot-Version'] = str(snapshot.version)
+        return response
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        return error_response(e)
+
+def iter_record_chunks(records, chunk_rows):
+    """Model-ready frames of at most chunk_rows posted JSON records"""
+    for start in range(0, len(records), chunk_rows):
+        chunk = pd.DataFrame.from_records(records[start:start + chunk_rows])
+        check_required(chunk.columns, SUSTAINABILITY_SCHEMA)
+        yield compact_frame(chunk, SUSTAINABILITY_SCHEMA)
 
 @app.route('/api/sustainability/analyze', methods=['GET'])
 def analyze_sustainability():
     try:
-        analysis = sustainability_model.analyze_sustainability(sustainability_df)
+        snapshot = snapshots.current
+        analysis = snapshot.sustainability_model.analyze_sustainability(snapshot.sustainability_df)
         return jsonify({
             'status': 'success',
-            'analysis': analysis
+            'analysis': analysis,
+            'snapshot_version': snapshot.version
         })
     except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        return error_response(e)
 
 @app.route('/api/sustainability/product/<product_id>', methods=['GET'])
 def get_product_sustainability(product_id):
     try:
-        suggestions = sustainability_model.get_improvement_suggestions(sustainability_df, product_id)
+        snapshot = snapshots.current
+        suggestions = snapshot.sustainability_model.get_improvement_suggestions(
+            snapshot.sustainability_df, product_id)
         return jsonify({
             'status': 'success',
-            'sustainability_analysis': suggestions
+            'sustainability_analysis': suggestions,
+            'snapshot_version': snapshot.version
         })
     except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        return error_response(e)
 
-@app.route('/api/sustainability/benchmark', methods=['POST'])
-def benchmark_products():
+@app.route('/api/sustainability/rank/<product_id>', methods=['GET'])
+def get_product_rank(product_id):
     try:
-        data = request.json
-        category = data.get('category', None)
-        
-        benchmarks = sustainability_model.benchmark_products(sustainability_df, category)
+        snapshot = snapshots.current
+        rank = snapshot.sustainability_model.product_rank(product_id)
+        if rank is None:
+            return jsonify({'status': 'error', 'message': 'Product not found'}), 404
         
         return jsonify({
             'status': 'success',
-            'benchmarks': benchmarks,
-            'category': category
+            'rank': rank,
+            'snapshot_version': snapshot.version
         })
     except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        return error_response(e)
+
+@app.route('/api/sustainability/benchmark', methods=['POST'])
+def benchmark_products():
+    try:
+        snapshot = snapshots.current
+        data = request.get_json(silent=True) or {}
+        category = data.get('category', request.args.get('category'))
+        offset = int(data.get('offset', request.args.get('offset', 0)))
+        limit = data.get('limit', request.args.get('limit'))
+        limit = int(limit) if limit is not None else None
+        if offset < 0 or (limit is not None and limit < 0):
+            return jsonify({'status': 'error', 'message': 'offset and limit must not be negative'}), 400
+        response_format = negotiate_format()
+        
+        model = snapshot.sustainability_model
+        benchmarks = model.benchmark_frame(snapshot.sustainability_df, category, offset, limit)
+        
+        return frame_response(benchmarks, list(benchmarks.columns), 'benchmarks', response_format,
+                              category=category, total=model.benchmark_size(category), offset=offset,
+                              limit=limit, snapshot_version=snapshot.version)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        return error_response(e)
+
+# Data upload endpoints: the upload is spooled to disk and ingested, validated and
+# swapped in by a background job, so reads keep being served from the current snapshot
+def spool_upload(file):
+    """Save an uploaded file to a temporary path for background ingestion"""
+    with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as spool:
+        file.save(spool)
+    return spool.name
+
+def accept_upload(kind, fn, *args):
+    job = ingestion_scheduler.submit(kind, fn, *args)
+    return jsonify({
+        'status': 'accepted',
+        'message': 'Upload accepted; ingestion runs in the background',
+        'job': job
+    }), 202
 
-# Data upload endpoints
 @app.route('/api/upload/sales', methods=['POST'])
 def upload_sales_data():
     try:
@@ -210,18 +626,56 @@ def upload_sales_data():
         
         file = request.files['file']
         if file.filename.endswith('.csv'):
-            global sales_df
-            sales_df = pd.read_csv(file)
-            return jsonify({
-                'status': 'success',
-                'message': 'Sales data uploaded successfully',
-                'rows': len(sales_df),
-                'columns': list(sales_df.columns)
-            })
+            mode = request.args.get('mode', request.form.get('mode', 'replace'))
+            if mode not in ('replace', 'append'):
+                return jsonify({'status': 'error', 'message': 'mode must be replace or append'}), 400
+            return accept_upload('ingest_sales', run_sales_ingestion, spool_upload(file), mode)
         else:
             return jsonify({'status': 'error', 'message': 'Please upload a CSV file'}), 400
     except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        return error_response(e)
+
+def run_sales_ingestion(report, path, mode):
+    """Ingest and validate spooled sales, then swap in a snapshot serving them"""
+    try:
+        report(0.1, 'ingest')
+        new_rows, ingestion = ingest_csv(path, SALES_SCHEMA)
+        validate_frame(new_rows, SALES_SCHEMA)
+        
+        report(0.5, 'index')
+        store = None
+        
+        def build(current):
+            nonlocal store
+            if mode == 'append':
+                # New rows are merged into the sorted history; only products that receive rows are re-summed
+                store = current.sales_store.append(new_rows)
+                cube = current.demand_cube.append(new_rows)
+            else:
+                store = SalesStore(new_rows, previous=current.sales_store)
+                cube = DemandCube.from_frame(new_rows)
+            forecast_cache.invalidate_products(store.changed_products)
+            return {'sales_store': store, 'demand_cube': cube}
+        
+        # Rows appended by another worker meanwhile are kept: ours are appended to theirs
+        snapshot = commit_rebuilt(build)
+        
+        # Extend the trained model with the appended rows only
+        training = None
+        if mode == 'append' and snapshot.demand_model.is_trained:
+            training = training_scheduler.submit('demand_update', run_demand_update, new_rows, store.generation)
+        
+        return {
+            'mode': mode,
+            'rows': len(store),
+            'new_rows': len(new_rows),
+            'columns': list(store.frame.columns),
+            'ingestion': ingestion,
+            'training_job': training,
+            'snapshot_version': snapshot.version
+        }
+    finally:
+        os.remove(path)
 
 @app.route('/api/upload/sustainability', methods=['POST'])
 def upload_sustainability_data():
@@ -231,18 +685,106 @@ def upload_sustainability_data():
         
         file = request.files['file']
         if file.filename.endswith('.csv'):
-            global sustainability_df
-            sustainability_df = pd.read_csv(file)
-            return jsonify({
-                'status': 'success',
-                'message': 'Sustainability data uploaded successfully',
-                'rows': len(sustainability_df),
-                'columns': list(sustainability_df.columns)
-            })
+            return accept_upload('ingest_sustainability', run_sustainability_ingestion, spool_upload(file))
         else:
             return jsonify({'status': 'error', 'message': 'Please upload a CSV file'}), 400
     except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        return error_response(e)
+
+def run_sustainability_ingestion(report, path):
+    """Ingest, validate and score spooled sustainability data, then swap it in"""
+    try:
+        report(0.1, 'ingest')
+        sustainability_df, ingestion = ingest_csv(path, SUSTAINABILITY_SCHEMA)
+        validate_frame(sustainability_df, SUSTAINABILITY_SCHEMA)
+        
+        # A new model is fitted; the served one is never modified
+        report(0.5, 'score')
+        model = SustainabilityModel()
+        model.fit(sustainability_df)
+        snapshot = commit_rebuilt(lambda current: {'sustainability_model': model,
+                                                   'sustainability_df': sustainability_df})
+        
+        return {
+            'rows': len(sustainability_df),
+            'columns': list(sustainability_df.columns),
+            'ingestion': ingestion,
+            'snapshot_version': snapshot.version
+        }
+    finally:
+        os.remove(path)
+
+# Metrics and profiling
+CACHE_LOOKUPS = REGISTRY.counter('forecast_cache_lookups_total', 'Per-product forecast cache lookups', ('result',))
+CACHE_ENTRIES = REGISTRY.gauge('forecast_cache_entries', 'Products with a cached forecast')
+CACHE_ROWS = REGISTRY.gauge('forecast_cache_rows', 'Forecast rows held by the cache')
+CACHE_HIT_RATIO = REGISTRY.gauge('forecast_cache_hit_ratio', 'Share of per-product lookups served from the cache')
+SNAPSHOT_VERSION = REGISTRY.gauge('snapshot_version', 'Version of the served data and model snapshot')
+MODEL_VERSION = REGISTRY.gauge('model_version', 'Process-local version of the served model', ('model',))
+MODEL_TRAINED = REGISTRY.gauge('model_trained', 'Whether the served model is trained', ('model',))
+DATASET_ROWS = REGISTRY.gauge('dataset_rows', 'Rows of the served dataset', ('dataset',))
+DATASET_PRODUCTS = REGISTRY.gauge('dataset_products', 'Distinct products of the served dataset', ('dataset',))
+JOBS = REGISTRY.gauge('background_jobs', 'Tracked training and ingestion jobs', ('kind', 'status'))
+
+def collect_serving_metrics():
+    """Refresh cache, version, dataset and job gauges from the served state"""
+    stats = forecast_cache.stats()
+    CACHE_LOOKUPS.set(stats['hits'], result='hit')
+    CACHE_LOOKUPS.set(stats['misses'], result='miss')
+    CACHE_ENTRIES.set(stats['entries'])
+    CACHE_ROWS.set(stats['rows'])
+    CACHE_HIT_RATIO.set(stats['hit_rate'] if stats['hit_rate'] is not None else 0.0)
+    
+    snapshot = snapshots.current
+    SNAPSHOT_VERSION.set(snapshot.version)
+    MODEL_VERSION.set(snapshot.demand_model.version, model='demand')
+    MODEL_TRAINED.set(int(snapshot.demand_model.is_trained), model='demand')
+    MODEL_TRAINED.set(int(snapshot.sustainability_model.is_trained), model='sustainability')
+    DATASET_ROWS.set(len(snapshot.sales_store.frame), dataset='sales')
+    DATASET_PRODUCTS.set(len(snapshot.sales_store.product_ids), dataset='sales')
+    DATASET_ROWS.set(len(snapshot.sustainability_df), dataset='sustainability')
+    DATASET_PRODUCTS.set(snapshot.sustainability_df['product_id'].nunique(), dataset='sustainability')
+    
+    JOBS.clear()
+    counts = {}
+    for job in training_scheduler.jobs() + ingestion_scheduler.jobs():
+        counts[job['kind'], job['status']] = counts.get((job['kind'], job['status']), 0) + 1
+    for (kind, status), count in counts.items():
+        JOBS.set(count, kind=kind, status=status)
+
+REGISTRY.add_collector(collect_serving_metrics)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+@app.route('/api/profiler', methods=['GET'])
+def profiler_report():
+    """Profiler status and hottest functions, or ?format=collapsed stacks for flame graphs"""
+    if request.args.get('format') == 'collapsed':
+        return Response(profiler.collapsed(), mimetype='text/plain')
+    limit = int(request.args.get('limit', 20))
+    return jsonify({
+        'status': 'success',
+        'profiler': profiler.status(),
+        'top_functions': profiler.top_functions(limit)
+    })
+
+@app.route('/api/profiler/start', methods=['POST'])
+def start_profiler():
+    try:
+        data = request.get_json(silent=True) or {}
+        duration = data.get('duration')
+        profiler.start(interval=float(data.get('interval', profiler.interval)),
+                       duration=float(duration) if duration is not None else None)
+        return jsonify({'status': 'success', 'profiler': profiler.status()})
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+@app.route('/api/profiler/stop', methods=['POST'])
+def stop_profiler():
+    profiler.stop()
+    return jsonify({'status': 'success', 'profiler': profiler.status()})
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    app.run(debug=True, host='0.0.0.0', port=5000)
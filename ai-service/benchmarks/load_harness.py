@@ -0,0 +1,386 @@
+"""Replay a mix of API calls from concurrent clients and report latency per endpoint
+
+Run from ai-service/. By default a local server is started on synthetic data,
+trained, and stopped afterwards:
+
+    python -m benchmarks.load_harness --clients 16 --duration 60 --output load.json
+    python -m benchmarks.load_harness --mix forecast=10 upload_sales=1 --slo slo.json   # exits 1 on violations
+    python -m benchmarks.load_harness --url http://replica:5000 --no-seed              # an already running server
+
+An SLO file maps endpoint names (or "overall") to limits, all optional:
+
+    {"forecast": {"p95_ms": 250, "p99_ms": 800, "error_rate": 0.01, "min_rps": 20},
+     "overall": {"p99_ms": 1000}}
+"""
+import pandas as pd
+import numpy as np
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+import logging
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+
+from .synthetic import generate_sales, generate_sustainability, product_ids
+
+logger = logging.getLogger(__name__)
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Relative weights of the endpoints replayed by default
+DEFAULT_MIX = {
+    'forecast': 4,
+    'analyze': 2,
+    'demand_product': 3,
+    'sustainability_product': 3,
+    'rank': 2,
+    'score': 2,
+    'benchmark': 2,
+    'upload_sales': 0.1,
+    'upload_sustainability': 0.1
+}
+PERCENTILES = (50, 95, 99)
+SLO_LIMITS = ('p50_ms', 'p95_ms', 'p99_ms', 'max_ms', 'error_rate', 'min_rps')
+
+
+def _multipart(filename, content, fields=None):
+    """multipart/form-data body carrying content as the file field; returns (body, content type)"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in (fields or {}).items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+                 f'Content-Type: text/csv\r\n\r\n'.encode() + content + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class Client:
+    """Minimal HTTP client over urllib; every call returns (status, body bytes)"""
+
+    def __init__(self, base_url, timeout=60):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, method, path, json_body=None, body=None, content_type=None):
+        headers = {}
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            content_type = 'application/json'
+        if content_type:
+            headers['Content-Type'] = content_type
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def json(self, method, path, json_body=None):
+        status, body = self.request(method, path, json_body)
+        return status, json.loads(body) if body else None
+
+
+def scenarios(products, sales_csv, sustainability_csv, days=30, benchmark_limit=100, score_batch=20):
+    """Endpoint name -> fn(rng) returning the request kwargs of one call"""
+    products = np.asarray(products, dtype=object)
+    sales_upload = _multipart('sales.csv', sales_csv, {'mode': 'replace'})
+    sustainability_upload = _multipart('sustainability.csv', sustainability_csv)
+
+    def product(rng):
+        return products[rng.integers(len(products))]
+
+    return {
+        'forecast': lambda rng: dict(method='POST', path='/api/demand/forecast', json_body={'days': days}),
+        'analyze': lambda rng: dict(method='GET', path='/api/demand/analyze'),
+        'demand_product': lambda rng: dict(method='GET', path=f'/api/demand/product/{product(rng)}'),
+        'sustainability_product': lambda rng: dict(method='GET', path=f'/api/sustainability/product/{product(rng)}'),
+        'rank': lambda rng: dict(method='GET', path=f'/api/sustainability/rank/{product(rng)}'),
+        'score': lambda rng: dict(method='POST', path='/api/sustainability/score', json_body={
+            'product_ids': rng.choice(products, min(score_batch, len(products)), replace=False).tolist()}),
+        'benchmark': lambda rng: dict(method='POST', path='/api/sustainability/benchmark',
+                                      json_body={'limit': benchmark_limit}),
+        'upload_sales': lambda rng: dict(method='POST', path='/api/upload/sales',
+                                         body=sales_upload[0], content_type=sales_upload[1]),
+        'upload_sustainability': lambda rng: dict(method='POST', path='/api/upload/sustainability',
+                                                  body=sustainability_upload[0],
+                                                  content_type=sustainability_upload[1])
+    }
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, log_path=None, startup_timeout=120):
+    """Start app.py under Flask's threaded server; returns (process, base url) once it answers"""
+    log = open(log_path, 'w') if log_path else subprocess.DEVNULL
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', str(port), '--with-threads'],
+        cwd=SERVICE_DIR, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f'http://127.0.0.1:{port}'
+    client = Client(base_url, timeout=5)
+    deadline = time.monotonic() + startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode} during startup")
+        try:
+            client.request('GET', '/')
+            return process, base_url
+        except (urllib.error.URLError, ConnectionError, socket.timeout):
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"Server did not answer within {startup_timeout}s")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def wait_for_job(client, job, timeout=600):
+    """Poll a background job until it finishes; returns its final record"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        _, body = client.json('GET', f"/api/jobs/{job['job_id']}")
+        job = body['job']
+        if job['status'] not in ('queued', 'running'):
+            if job['status'] != 'succeeded':
+                raise RuntimeError(f"Job {job['job_id']} ({job['kind']}) {job['status']}: {job.get('error')}")
+            return job
+        time.sleep(0.2)
+    raise RuntimeError(f"Job {job['job_id']} did not finish within {timeout}s")
+
+
+def seed_server(client, sales_csv, sustainability_csv):
+    """Serve the synthetic data and a demand model trained on it"""
+    for path, name, content, fields in [('/api/upload/sales', 'sales.csv', sales_csv, {'mode': 'replace'}),
+                                        ('/api/upload/sustainability', 'sustainability.csv', sustainability_csv, {})]:
+        body, content_type = _multipart(name, content, fields)
+        status, response = client.request('POST', path, body=body, content_type=content_type)
+        if status != 202:
+            raise RuntimeError(f"Seeding {path} failed with {status}: {response[:200]!r}")
+        wait_for_job(client, json.loads(response)['job'])
+    train_server(client)
+
+
+def train_server(client):
+    status, body = client.json('POST', '/api/demand/train')
+    if status != 202:
+        raise RuntimeError(f"Training request failed with {status}: {body}")
+    wait_for_job(client, body['job'])
+
+
+def run_load(base_url, mix, calls, clients=8, duration=30.0, warmup=0.0, seed=42, timeout=60):
+    """Replay calls weighted by mix from concurrent clients
+
+    Returns the (endpoint, start offset, seconds, status) of every call
+    started after warmup, and the measured wall time.
+    """
+    names = [name for name, weight in mix.items() if weight > 0]
+    weights = np.array([mix[name] for name in names], dtype=float)
+    weights /= weights.sum()
+    records = []
+    lock = threading.Lock()
+    start = time.perf_counter()
+    measure_from = start + warmup
+    stop_at = measure_from + duration
+
+    def client_loop(index):
+        client = Client(base_url, timeout)
+        rng = np.random.default_rng(seed + index)
+        local = []
+        while True:
+            begin = time.perf_counter()
+            if begin >= stop_at:
+                break
+            name = names[rng.choice(len(names), p=weights)]
+            try:
+                status, _ = client.request(**calls[name](rng))
+            except (urllib.error.URLError, ConnectionError, socket.timeout) as e:
+                logger.debug("%s failed: %s", name, e)
+                status = 0
+            end = time.perf_counter()
+            if begin >= measure_from:
+                local.append((name, begin - measure_from, end - begin, status))
+        with lock:
+            records.extend(local)
+
+    threads = [threading.Thread(target=client_loop, args=(i,), daemon=True) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Calls still in flight at the deadline finish after it
+    wall = max(time.perf_counter() - measure_from, duration)
+    return records, wall
+
+
+def summarize(records, wall):
+    """Throughput, error rate and latency percentiles per endpoint and overall"""
+    frame = pd.DataFrame(records, columns=['endpoint', 'offset', 'seconds', 'status'])
+    summary = {}
+    groups = list(frame.groupby('endpoint', sort=True)) + [('overall', frame)]
+    for name, calls in groups:
+        if not len(calls):
+            continue
+        latency_ms = calls['seconds'].to_numpy() * 1000
+        # Uploads answer 202; connection failures are recorded as status 0
+        errors = int(((calls['status'] >= 400) | (calls['status'] == 0)).sum())
+        summary[name] = {
+            'requests': len(calls),
+            'rps': round(len(calls) / wall, 2),
+            'error_rate': round(errors / len(calls), 4),
+            **{f'p{p}_ms': round(float(v), 2) for p, v in zip(PERCENTILES, np.percentile(latency_ms, PERCENTILES))},
+            'max_ms': round(float(latency_ms.max()), 2),
+            'statuses': {str(status): int(count) for status, count in calls['status'].value_counts().items()}
+        }
+    return summary
+
+
+def check_slo(summary, slo):
+    """Violations of the SLO limits; endpoints absent from the run violate any SLO set for them"""
+    violations = []
+    for name, limits in slo.items():
+        unknown = set(limits) - set(SLO_LIMITS)
+        if unknown:
+            raise ValueError(f"Unknown SLO limits for {name}: {', '.join(sorted(unknown))}")
+        measured = summary.get(name)
+        if measured is None:
+            violations.append({'endpoint': name, 'limit': 'requests', 'expected': '> 0', 'actual': 0})
+            continue
+        for limit, expected in limits.items():
+            actual = measured['rps'] if limit == 'min_rps' else measured[limit]
+            failed = actual < expected if limit == 'min_rps' else actual > expected
+            if failed:
+                violations.append({'endpoint': name, 'limit': limit, 'expected': expected, 'actual': actual})
+    return violations
+
+
+def job_summary(client):
+    """Background job counts by kind and status; uploads fail in their job, not their request"""
+    _, body = client.json('GET', '/api/jobs')
+    counts = {}
+    for job in body['jobs']:
+        kind = counts.setdefault(job['kind'], {})
+        kind[job['status']] = kind.get(job['status'], 0) + 1
+    return counts
+
+
+def _mix_entry(text):
+    name, weight = text.split('=')
+    return name, float(weight)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent load test of the retail analytics API")
+    parser.add_argument('--url', help="Test this running server instead of starting one")
+    parser.add_argument('--port', type=int, help="Port of the started server (default: a free one)")
+    parser.add_argument('--server-log', help="Write the started server's output here")
+    parser.add_argument('--clients', type=int, default=8, help="Concurrent clients")
+    parser.add_argument('--duration', type=float, default=30.0, help="Measured seconds")
+    parser.add_argument('--warmup', type=float, default=5.0, help="Unmeasured seconds before measuring")
+    parser.add_argument('--mix', type=_mix_entry, nargs='+',
+                        help="endpoint=weight pairs replacing the default mix: " + ', '.join(DEFAULT_MIX))
+    parser.add_argument('--rows', type=int, default=20_000, help="Synthetic sales rows served and uploaded")
+    parser.add_argument('--products', type=int, default=200, help="Synthetic products")
+    parser.add_argument('--days', type=int, default=30, help="Forecast horizon")
+    parser.add_argument('--no-seed', action='store_true',
+                        help="Keep the server's data and model; product lookups use ids from its benchmark")
+    parser.add_argument('--timeout', type=float, default=60.0, help="Per-request timeout")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--slo', help="SLO JSON; exit 1 when any limit is violated")
+    parser.add_argument('--output', help="Write the report JSON here")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    mix = dict(args.mix) if args.mix else dict(DEFAULT_MIX)
+
+    sales = generate_sales(args.rows, args.products, seed=args.seed)
+    sustainability = generate_sustainability(args.products, seed=args.seed)
+    sales_csv = sales.assign(date=sales['date'].dt.strftime('%Y-%m-%d')).to_csv(index=False).encode()
+    sustainability_csv = sustainability.to_csv(index=False).encode()
+
+    process = None
+    if args.url:
+        base_url = args.url
+    else:
+        process, base_url = start_server(args.port or _free_port(), args.server_log)
+        logger.info("Started server at %s", base_url)
+    try:
+        client = Client(base_url, args.timeout)
+        if args.no_seed:
+            _, body = client.json('POST', '/api/sustainability/benchmark', {})
+            products = [row['product_id'] for row in body['benchmarks']]
+        else:
+            logger.info("Seeding %d sales rows over %d products and training", args.rows, args.products)
+            seed_server(client, sales_csv, sustainability_csv)
+            products = product_ids(args.products)
+
+        calls = scenarios(products, sales_csv, sustainability_csv, days=args.days)
+        unknown = set(mix) - set(calls)
+        if unknown:
+            parser.error(f"Unknown endpoints in --mix: {', '.join(sorted(unknown))}")
+
+        logger.info("Running %d clients for %.0fs (+%.0fs warmup)", args.clients, args.duration, args.warmup)
+        records, wall = run_load(base_url, mix, calls, args.clients, args.duration, args.warmup,
+                                 args.seed, args.timeout)
+        jobs = job_summary(client)
+    finally:
+        if process is not None:
+            stop_server(process)
+
+    summary = summarize(records, wall)
+    logger.info("%-24s %9s %9s %8s %9s %9s %9s %9s", 'endpoint', 'requests', 'req/s', 'errors',
+                'p50 ms', 'p95 ms', 'p99 ms', 'max ms')
+    for name, row in summary.items():
+        logger.info("%-24s %9d %9.1f %7.2f%% %9.1f %9.1f %9.1f %9.1f", name, row['requests'], row['rps'],
+                    row['error_rate'] * 100, row['p50_ms'], row['p95_ms'], row['p99_ms'], row['max_ms'])
+
+    report = {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'url': None if process is not None else base_url,
+        'clients': args.clients,
+        'duration': round(wall, 2),
+        'mix': mix,
+        'rows': None if args.no_seed else args.rows,
+        'products': None if args.no_seed else args.products,
+        'endpoints': summary,
+        'jobs': jobs
+    }
+    for kind, statuses in jobs.items():
+        if statuses.get('failed'):
+            logger.warning("%d %s jobs failed", statuses['failed'], kind)
+
+    if args.slo:
+        with open(args.slo) as f:
+            slo = json.load(f)
+        report['slo_violations'] = check_slo(summary, slo)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.slo:
+        for violation in report['slo_violations']:
+            logger.warning("SLO VIOLATION %s %s: %s (limit %s)", violation['endpoint'], violation['limit'],
+                           violation['actual'], violation['expected'])
+        if report['slo_violations']:
+            return 1
+        logger.info("All SLOs met (%s)", args.slo)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""Benchmark the demand and sustainability hot paths on synthetic data
+
+Run from ai-service/:
+
+    python -m benchmarks.run_benchmarks --output results.json
+    python -m benchmarks.run_benchmarks --baseline baseline.json   # exits 1 on regressions
+    python -m benchmarks.run_benchmarks --scales 1000:10 100000:1000 --save-baseline baseline.json
+"""
+import pandas as pd
+import numpy as np
+import sklearn
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import logging
+from datetime import datetime, timezone
+
+from src.models.demand_forecasting.demand_model import DemandForecastingModel
+from src.models.sustainability.sustainability_model import SustainabilityModel
+from .synthetic import generate_sales, generate_sustainability
+
+logger = logging.getLogger(__name__)
+
+# (rows, products) per scale, 10^3 to 10^7 rows
+DEFAULT_SCALES = [(1_000, 10), (10_000, 100), (100_000, 1_000), (1_000_000, 10_000), (10_000_000, 100_000)]
+# Forest training beyond this many rows is skipped unless raised
+DEFAULT_MAX_TRAIN_ROWS = 1_000_000
+OPERATIONS = ('prepare_features', 'train', 'predict', 'analyze_demand',
+              'calculate_sustainability_score', 'benchmark_products')
+
+
+def measure(fn):
+    """Run fn once; returns (result, seconds, peak traced allocation in MB)
+
+    Peaks come from tracemalloc, which NumPy and pandas buffers report to;
+    tracing adds a similar overhead to every run, so runs stay comparable.
+    """
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        result = fn()
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, seconds, peak / 1024 ** 2
+
+
+def run_scale(rows, products, days=30, max_train_rows=DEFAULT_MAX_TRAIN_ROWS, benchmark_limit=1000):
+    """Time every operation at one scale"""
+    sales = generate_sales(rows, products)
+    sustainability = generate_sustainability(rows)
+    demand_model = DemandForecastingModel()
+    trained = rows <= max_train_rows
+    results = []
+
+    def record(operation, fn, n_rows):
+        result, seconds, peak_mb = measure(fn)
+        results.append({
+            'rows': rows,
+            'products': products,
+            'operation': operation,
+            'seconds': round(seconds, 4),
+            'rows_per_sec': round(n_rows / seconds) if seconds > 0 else None,
+            'peak_mb': round(peak_mb, 1)
+        })
+        logger.info("%9d rows %7d products  %-31s %9.3fs  %12s rows/s  %9.1f MB", rows, products,
+                    operation, seconds, results[-1]['rows_per_sec'], peak_mb)
+        return result
+
+    record('prepare_features', lambda: demand_model.prepare_features(sales), rows)
+    if trained:
+        record('train', lambda: demand_model.train(sales), rows)
+        record('predict', lambda: demand_model.predict(sales, days=days), products * days)
+    else:
+        logger.info("Skipping train and predict at %d rows (--max-train-rows %d)", rows, max_train_rows)
+    record('analyze_demand', lambda: demand_model.analyze_demand(sales), rows)
+
+    sustainability_model = SustainabilityModel()
+    record('calculate_sustainability_score',
+           lambda: sustainability_model.calculate_sustainability_score(sustainability), rows)
+    record('benchmark_products',
+           lambda: sustainability_model.benchmark_products(sustainability, limit=benchmark_limit), rows)
+
+    return results
+
+
+def environment():
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'sklearn': sklearn.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count()
+    }
+
+
+def compare(results, baseline, time_tolerance=0.2, memory_tolerance=0.2):
+    """Results slower or larger than their baseline entry beyond the tolerances"""
+    previous = {(entry['rows'], entry['products'], entry['operation']): entry for entry in baseline['results']}
+    regressions = []
+    for entry in results:
+        before = previous.get((entry['rows'], entry['products'], entry['operation']))
+        if before is None:
+            continue
+        time_ratio = entry['seconds'] / before['seconds'] if before['seconds'] else 1.0
+        memory_ratio = entry['peak_mb'] / before['peak_mb'] if before['peak_mb'] else 1.0
+        if time_ratio > 1 + time_tolerance or memory_ratio > 1 + memory_tolerance:
+            regressions.append({**entry, 'baseline_seconds': before['seconds'],
+                                'baseline_peak_mb': before['peak_mb'],
+                                'time_ratio': round(time_ratio, 2), 'memory_ratio': round(memory_ratio, 2)})
+    return regressions
+
+
+def _scale(text):
+    rows, products = text.split(':')
+    return int(float(rows)), int(float(products))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark demand and sustainability hot paths")
+    parser.add_argument('--scales', type=_scale, nargs='+', default=DEFAULT_SCALES,
+                        help="rows:products pairs, e.g. 1e5:1000")
+    parser.add_argument('--days', type=int, default=30, help="Forecast horizon for predict")
+    parser.add_argument('--max-train-rows', type=int, default=DEFAULT_MAX_TRAIN_ROWS)
+    parser.add_argument('--benchmark-limit', type=int, default=1000, help="Page size for benchmark_products")
+    parser.add_argument('--output', help="Write results JSON here")
+    parser.add_argument('--baseline', help="Compare against this results JSON and exit 1 on regressions")
+    parser.add_argument('--save-baseline', help="Also write the results as a baseline here")
+    parser.add_argument('--time-tolerance', type=float, default=0.2, help="Allowed slowdown, 0.2 = 20%%")
+    parser.add_argument('--memory-tolerance', type=float, default=0.2, help="Allowed peak memory growth")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    results = []
+    for rows, products in args.scales:
+        results += run_scale(rows, products, args.days, args.max_train_rows, args.benchmark_limit)
+    report = {'environment': environment(), 'results': results}
+
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.time_tolerance, args.memory_tolerance)
+        for entry in regressions:
+            logger.warning("REGRESSION %s at %d rows: %.3fs (baseline %.3fs, x%.2f), %.1f MB (baseline %.1f MB, x%.2f)",
+                           entry['operation'], entry['rows'], entry['seconds'], entry['baseline_seconds'],
+                           entry['time_ratio'], entry['peak_mb'], entry['baseline_peak_mb'], entry['memory_ratio'])
+        if regressions:
+            return 1
+        logger.info("No regressions against %s", args.baseline)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
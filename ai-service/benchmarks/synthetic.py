@@ -0,0 +1,72 @@
+import pandas as pd
+import numpy as np
+
+CATEGORIES = ['Electronics', 'Clothing', 'Home', 'Sports', 'Books', 'Garden', 'Beauty', 'Toys']
+# Longest run of sales days per product; busier products sell several times a day
+MAX_DAYS = 730
+
+
+def product_ids(n_products):
+    """Product ids PROD000001, PROD000002, ..."""
+    return np.array([f'PROD{i:06d}' for i in range(1, n_products + 1)], dtype=object)
+
+
+def generate_sales(n_rows, n_products, start='2023-01-01', seed=42):
+    """Synthetic sales rows in the compact dtypes produced by ingestion
+
+    Product popularity is skewed, every product sells on a roughly
+    contiguous run of days, and quantities follow a per-product Poisson
+    rate with a weekend lift. Fully vectorized, so 10^7 rows take seconds.
+    """
+    rng = np.random.default_rng(seed)
+    n_products = min(n_products, n_rows)
+
+    # Every product gets at least one row; the rest follow a Zipf-like popularity
+    popularity = 1.0 / np.arange(1, n_products + 1) ** 0.8
+    extra = rng.multinomial(n_rows - n_products, popularity / popularity.sum())
+    counts = 1 + rng.permutation(extra)
+    product = np.repeat(np.arange(n_products), counts)
+
+    # A run of consecutive days per product from a random first day
+    first_day = rng.integers(0, 365, n_products)
+    position = np.arange(n_rows) - np.repeat(np.cumsum(counts) - counts, counts)
+    span = np.minimum(counts, MAX_DAYS) / counts
+    day = np.repeat(first_day, counts) + (position * np.repeat(span, counts)).astype(np.int64)
+    dates = np.datetime64(start, 'D') + day
+
+    rate = rng.lognormal(2.0, 0.6, n_products)[product]
+    weekend = (dates.astype('datetime64[D]').view('int64') + 3) % 7 >= 5
+    quantity = rng.poisson(rate * np.where(weekend, 1.3, 1.0)).astype(np.int32)
+    price = rng.uniform(5, 200, n_products)[product].astype(np.float32)
+
+    # Rows arrive in no particular order, as uploads do
+    order = rng.permutation(n_rows)
+    return pd.DataFrame({
+        'product_id': pd.Categorical.from_codes(product[order], product_ids(n_products)),
+        'date': pd.DatetimeIndex(dates[order].astype('datetime64[ns]')),
+        'quantity': quantity[order],
+        'price': price[order]
+    })
+
+
+def generate_sustainability(n_rows, seed=42, missing_rate=0.05):
+    """Synthetic sustainability rows, one per product, with some missing values
+
+    Product ids stay plain strings: a categorical of 10^7 distinct ids costs
+    more to build than it saves.
+    """
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame({
+        'product_id': product_ids(n_rows),
+        'category': pd.Categorical.from_codes(rng.integers(0, len(CATEGORIES), n_rows), CATEGORIES),
+        'carbon_footprint': rng.uniform(0.5, 5.0, n_rows).astype(np.float32),
+        'recyclability': rng.uniform(0, 100, n_rows).astype(np.float32),
+        'packaging_score': rng.uniform(0, 100, n_rows).astype(np.float32),
+        'sourcing_score': rng.uniform(0, 100, n_rows).astype(np.float32),
+        'durability': rng.uniform(1, 10, n_rows).astype(np.float32),
+        'end_of_life_score': rng.uniform(0, 100, n_rows).astype(np.float32)
+    })
+
+    for col in ['carbon_footprint', 'recyclability', 'packaging_score', 'durability']:
+        data.loc[rng.random(n_rows) < missing_rate, col] = np.nan
+    return data
@@ -0,0 +1,154 @@
+import pandas as pd
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = ('day', 'week', 'month', 'product', 'category')
+
+
+class DemandCube:
+    """Sales pre-aggregated into (product, day) buckets
+
+    Holds per-bucket quantity sums and order counts together with daily and
+    per-product totals, so demand analysis and range queries cost in the
+    number of buckets (or days/products) rather than in raw sales rows.
+    Appending sales aggregates only the new rows and merges them by bucket.
+    """
+
+    def __init__(self, buckets, daily, products, total_orders):
+        self.buckets = buckets
+        self.daily = daily
+        self.products = products
+        self.total_orders = total_orders
+
+    @staticmethod
+    def _aggregate(data):
+        """(product, day) buckets of quantity sum, valid quantity count and row count"""
+        quantity = data['quantity']
+        if pd.api.types.is_integer_dtype(quantity):
+            # Ingestion downcasts quantities; sums need the full width
+            quantity = quantity.astype(np.int64)
+        frame = pd.DataFrame({
+            'product_id': data['product_id'].to_numpy(),
+            'day': pd.to_datetime(data['date']).dt.normalize().to_numpy(),
+            'quantity': quantity.to_numpy()
+        })
+        grouped = frame.groupby(['product_id', 'day'], sort=False)['quantity']
+        return pd.DataFrame({
+            'total_sales': grouped.sum(),
+            'valid': grouped.count(),
+            'orders': grouped.size()
+        })
+
+    @classmethod
+    def from_frame(cls, data):
+        """Build the cube from a sales frame with product_id, date and quantity"""
+        buckets = cls._aggregate(data)
+        return cls(buckets, cls._by_day(buckets), cls._by_product(buckets), len(data))
+
+    @staticmethod
+    def _by_day(buckets):
+        return buckets.groupby(level='day').sum()
+
+    @staticmethod
+    def _by_product(buckets):
+        return buckets.groupby(level='product_id').sum()
+
+    def append(self, new_rows):
+        """New cube with new_rows merged in
+
+        Only the new rows are aggregated. Their buckets that already exist are
+        added to by position and the others appended, so no bucket is re-summed;
+        the bucket table is still copied, as a cube is never changed in place.
+        """
+        new = self._aggregate(new_rows)
+
+        overlap = new.index.isin(self.buckets.index)
+        buckets = self.buckets
+        if overlap.any():
+            touched = new[overlap]
+            positions = buckets.index.get_indexer(touched.index)
+            columns = {}
+            for column in buckets.columns:
+                dtype = np.result_type(buckets[column].dtype, touched[column].dtype)
+                values = buckets[column].to_numpy(dtype=dtype, copy=True)
+                values[positions] += touched[column].to_numpy(dtype=dtype)
+                columns[column] = values
+            buckets = pd.DataFrame(columns, index=buckets.index)
+        if not overlap.all():
+            buckets = pd.concat([buckets, new[~overlap]])
+        daily = self.daily.add(self._by_day(new), fill_value=0).astype(self.daily.dtypes.to_dict())
+        products = self.products.add(self._by_product(new), fill_value=0).astype(self.products.dtypes.to_dict())
+
+        return DemandCube(buckets, daily, products, self.total_orders + len(new_rows))
+
+    def analysis(self):
+        """Demand summary in the shape returned by DemandForecastingModel.analyze_demand"""
+        product_stats = pd.DataFrame({
+            'total_sales': self.products['total_sales'],
+            'avg_sales': self.products['total_sales'] / self.products['valid'],
+            'order_count': self.products['valid']
+        }).round(2)
+
+        top_products = product_stats.sort_values('total_sales', ascending=False, kind='stable').head(10)
+        bottom_products = product_stats.sort_values('total_sales', ascending=True, kind='stable').head(10)
+        monthly_sales = self.daily['total_sales'].groupby(self.daily.index.month).sum()
+
+        return {
+            'product_stats': product_stats.to_dict('index'),
+            'top_products': top_products.to_dict('index'),
+            'bottom_products': bottom_products.to_dict('index'),
+            'daily_avg': self.daily['total_sales'].mean(),
+            'monthly_totals': {int(month): total for month, total in monthly_sales.items()},
+            'total_orders': self.total_orders,
+            'unique_products': len(self.products)
+        }
+
+    def aggregate(self, granularity='day', start=None, end=None, product_id=None, categories=None):
+        """Total sales and orders per period, product or category within a date range
+
+        categories maps product_id to category and is required for the
+        'category' granularity.
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of: {', '.join(GRANULARITIES)}")
+        if granularity == 'category' and categories is None:
+            raise ValueError("Category aggregation needs a product category mapping")
+
+        ranged = start is not None or end is not None
+        start = pd.Timestamp(start) if start is not None else None
+        end = pd.Timestamp(end) if end is not None else None
+
+        if product_id is not None or (ranged and granularity in ('product', 'category')):
+            # Needs per-product detail: filter buckets instead of raw rows
+            buckets = self.buckets
+            if product_id is not None:
+                buckets = buckets[buckets.index.get_level_values('product_id') == product_id]
+            days = buckets.index.get_level_values('day')
+            if start is not None:
+                buckets, days = buckets[days >= start], days[days >= start]
+            if end is not None:
+                buckets, days = buckets[days <= end], days[days <= end]
+            daily = buckets.groupby(days).sum()
+            products = buckets.groupby(level='product_id').sum()
+        else:
+            daily = self.daily.loc[start:end] if ranged else self.daily
+            products = self.products
+
+        if granularity == 'product':
+            totals = products
+        elif granularity == 'category':
+            totals = products.groupby(products.index.map(categories).fillna('Uncategorized')).sum()
+        else:
+            index = daily.index
+            if granularity == 'week':
+                index = (index - pd.to_timedelta(index.dayofweek, unit='D')).strftime('%Y-%m-%d')
+            elif granularity == 'month':
+                index = index.strftime('%Y-%m')
+            else:
+                index = index.strftime('%Y-%m-%d')
+            totals = daily.groupby(np.asarray(index)).sum()
+
+        return [{'key': key, 'total_sales': row.total_sales, 'order_count': int(row.orders)}
+                for key, row in zip(totals.index, totals.itertuples(index=False))]
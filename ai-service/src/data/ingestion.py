@@ -0,0 +1,190 @@
+import pandas as pd
+from pandas.api.types import union_categoricals
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNKSIZE = 250_000
+
+# Upload column name -> model column name, plus the dtype each model column is stored as
+SALES_SCHEMA = {
+    'aliases': {
+        'ProductID': 'product_id',
+        'Date': 'date',
+        'QuantitySold': 'quantity',
+        'UnitPrice': 'price'
+    },
+    'required': ['product_id', 'date', 'quantity'],
+    'optional': ['price'],
+    'categories': ['product_id'],
+    'dates': ['date'],
+    'integers': ['quantity'],
+    'floats': ['price'],
+    'flags': [],
+    'non_negative': ['quantity', 'price']
+}
+
+SUSTAINABILITY_SCHEMA = {
+    'aliases': {
+        'ProductID': 'product_id',
+        'Material': 'category',
+        'CarbonFootprintKg': 'carbon_footprint',
+        'Recyclable': 'recyclability',
+        'AvgLifespanYears': 'durability'
+    },
+    'required': ['product_id'],
+    'optional': ['category', 'carbon_footprint', 'recyclability', 'packaging_score',
+                 'sourcing_score', 'durability', 'end_of_life_score'],
+    'categories': ['product_id', 'category'],
+    'dates': [],
+    'integers': [],
+    'floats': ['carbon_footprint', 'recyclability', 'packaging_score',
+               'sourcing_score', 'durability', 'end_of_life_score'],
+    # Yes/No columns are stored on the 0-100 scale of the score columns
+    'flags': ['recyclability'],
+    'non_negative': ['carbon_footprint', 'durability']
+}
+
+FLAG_VALUES = {'yes': 100.0, 'y': 100.0, 'true': 100.0, 'no': 0.0, 'n': 0.0, 'false': 0.0}
+
+
+def _canonical(column, schema):
+    """Model column name for an upload column"""
+    return schema['aliases'].get(column, column)
+
+
+def compact_frame(chunk, schema):
+    """Rename raw upload columns to model columns and downcast them"""
+    chunk = chunk.rename(columns=schema['aliases'])
+
+    for col in schema['dates']:
+        chunk[col] = pd.to_datetime(chunk[col])
+    for col in schema['flags']:
+        if col in chunk and not pd.api.types.is_numeric_dtype(chunk[col]):
+            chunk[col] = chunk[col].astype(str).str.strip().str.lower().map(FLAG_VALUES)
+    for col in schema['integers']:
+        if col in chunk:
+            values = pd.to_numeric(chunk[col], errors='coerce')
+            # Integer downcast only applies when the chunk has no missing values
+            chunk[col] = pd.to_numeric(values, downcast='integer' if values.notna().all() else 'float')
+    for col in schema['floats']:
+        if col in chunk:
+            chunk[col] = pd.to_numeric(pd.to_numeric(chunk[col], errors='coerce'), downcast='float')
+    for col in schema['categories']:
+        if col in chunk:
+            chunk[col] = chunk[col].astype('category')
+
+    return chunk
+
+
+def concat_frames(frames):
+    """Concatenate frames, merging categorical columns instead of falling back to object"""
+    frames = [frame for frame in frames if len(frame.columns)]
+    if not frames:
+        return pd.DataFrame()
+
+    categorical = [col for col in frames[0].columns
+                   if all(isinstance(frame[col].dtype, pd.CategoricalDtype)
+                          for frame in frames if col in frame)]
+    combined = pd.concat([frame.drop(columns=categorical) for frame in frames], ignore_index=True)
+    for col in categorical:
+        merged = union_categoricals([frame[col] for frame in frames if col in frame])
+        combined[col] = pd.Categorical(merged)
+
+    columns = list(dict.fromkeys(col for frame in frames for col in frame.columns))
+    return combined[columns]
+
+
+def rss_mb():
+    """Current resident set size of this process in MB, None where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+
+
+def check_required(columns, schema):
+    """Raise ValueError if upload columns lack any required model column"""
+    present = {_canonical(column, schema) for column in columns}
+    missing = [col for col in schema['required'] if col not in present]
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}")
+
+
+def validate_frame(frame, schema):
+    """Raise ValueError if an ingested frame is empty or has invalid values
+
+    Identifier and date columns must be present on every row; measures
+    may be missing but never negative where the schema rules it out.
+    """
+    if frame.empty:
+        raise ValueError("Upload contains no rows")
+
+    keys = [col for col in schema['required'] if col in schema['categories'] or col in schema['dates']]
+    for col in keys:
+        missing = int(frame[col].isna().sum())
+        if missing:
+            raise ValueError(f"{missing} rows have no {col}")
+    for col in schema.get('non_negative', []):
+        if col in frame:
+            negative = int((frame[col] < 0).sum())
+            if negative:
+                raise ValueError(f"{negative} rows have a negative {col}")
+
+
+def iter_csv_chunks(source, schema, chunksize=DEFAULT_CHUNKSIZE):
+    """Yield compact, model-ready frames of at most chunksize rows from a CSV source"""
+    known = set(schema['required']) | set(schema['optional'])
+    text_columns = {alias: str for alias, col in schema['aliases'].items() if col in schema['categories']}
+    text_columns.update({col: str for col in schema['categories']})
+
+    reader = pd.read_csv(
+        source,
+        chunksize=chunksize,
+        usecols=lambda column: _canonical(column, schema) in known,
+        dtype=text_columns
+    )
+
+    for chunk in reader:
+        check_required(chunk.columns, schema)
+        yield compact_frame(chunk, schema)
+
+
+def ingest_csv(source, schema, chunksize=DEFAULT_CHUNKSIZE):
+    """Read a CSV upload in bounded chunks into a compact, model-ready frame
+
+    Returns (frame, stats) where stats reports rows, throughput and memory.
+    rss_growth_mb is how far the process RSS rose above its level at the start,
+    sampled after every chunk and after the final concatenation; memory freed
+    by earlier work and reused here is not counted.
+    """
+    start = time.perf_counter()
+    rss = [rss_mb()]
+    chunks = []
+    for chunk in iter_csv_chunks(source, schema, chunksize):
+        chunks.append(chunk)
+        rss.append(rss_mb())
+
+    frame = concat_frames(chunks)
+    # The chunks are still alive, so this is the high point of the ingestion
+    rss.append(rss_mb())
+    if frame.empty:
+        frame = pd.DataFrame(columns=schema['required'])
+
+    seconds = time.perf_counter() - start
+    stats = {
+        'rows': len(frame),
+        'chunks': len(chunks),
+        'seconds': round(seconds, 3),
+        'rows_per_sec': round(len(frame) / seconds) if seconds > 0 else None,
+        'frame_mb': round(float(frame.memory_usage(deep=True).sum()) / 1024 ** 2, 2),
+        'rss_growth_mb': round(max(rss) - rss[0], 1) if rss[0] is not None else None
+    }
+    logger.info("Ingested %(rows)d rows in %(chunks)d chunks (%(rows_per_sec)s rows/sec, "
+                "RSS +%(rss_growth_mb)s MB)", stats)
+
+    return frame, stats
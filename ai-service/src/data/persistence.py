@@ -0,0 +1,163 @@
+import joblib
+import json
+import os
+import time
+import fcntl
+import threading
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from src.data.snapshots import StateConflict
+from src.models.demand_forecasting.demand_model import next_model_version
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = 'CURRENT'
+LOCK_FILE = '.publish.lock'
+# Published versions whose component files are kept for workers still loading them
+KEEP_VERSIONS = 3
+
+# State directories whose publish lock each thread holds, with its nesting depth
+_held_locks = threading.local()
+
+
+def read_manifest(state_dir):
+    """Current published manifest of state_dir, None if nothing was published
+
+    The manifest maps each state component to the snapshot file holding it,
+    together with a version that grows on every publish; checking it is one
+    small file read.
+    """
+    try:
+        with open(os.path.join(state_dir, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+@contextmanager
+def publish_lock(state_dir):
+    """Serialize publishers of state_dir across processes and threads; readers never take it
+
+    Reentrant within a thread, so an update can be built and published
+    under one hold, with no other publisher in between.
+    """
+    key = os.path.abspath(state_dir)
+    held = _held_locks.__dict__.setdefault('depths', {})
+    if key in held:
+        held[key] += 1
+        try:
+            yield
+        finally:
+            held[key] -= 1
+        return
+
+    os.makedirs(state_dir, exist_ok=True)
+    with open(os.path.join(state_dir, LOCK_FILE), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        held[key] = 1
+        try:
+            yield
+        finally:
+            del held[key]
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def publish_state(state_dir, components, expected=None):
+    """Write state components and publish them as a new state version
+
+    components maps a component name to a dict of objects saved together
+    (objects shared within a component stay shared). Each component is one
+    uncompressed joblib pickle, so its arrays can be memory-mapped by every
+    reader. Components not given keep their current files. The manifest is
+    replaced atomically last, so readers see either the old or the new
+    version, never a partial one. Returns the new manifest.
+
+    expected maps component names to the files the new objects were built
+    from (no entry: never published). If another publisher replaced one of
+    the given components since, StateConflict is raised and nothing is
+    written, so concurrent updates are never silently lost.
+    """
+    os.makedirs(state_dir, exist_ok=True)
+    start = time.perf_counter()
+
+    with publish_lock(state_dir):
+        current = read_manifest(state_dir) or {'version': 0, 'components': {}}
+        if expected is not None:
+            stale = [name for name in components if current['components'].get(name) != expected.get(name)]
+            if stale:
+                raise StateConflict(stale)
+        version = current['version'] + 1
+
+        files = dict(current['components'])
+        for name, objects in components.items():
+            files[name] = f'{name}-{version:06d}.joblib'
+            joblib.dump(objects, os.path.join(state_dir, files[name]))
+
+        manifest = {
+            'version': version,
+            'components': files,
+            'saved_at': datetime.now(timezone.utc).isoformat(timespec='seconds')
+        }
+        tmp_path = os.path.join(state_dir, f'{MANIFEST_FILE}.{os.getpid()}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(state_dir, MANIFEST_FILE))
+
+        _prune(state_dir, manifest)
+
+    logger.info("Published state version %d (%s) in %.2fs",
+                version, ', '.join(components), time.perf_counter() - start)
+    return manifest
+
+
+def _prune(state_dir, manifest):
+    """Remove component files superseded more than KEEP_VERSIONS versions ago
+
+    Processes that already mapped a removed file keep reading it; the data
+    is freed once the last mapping is closed.
+    """
+    live = set(manifest['components'].values())
+    for filename in os.listdir(state_dir):
+        if not filename.endswith('.joblib') or filename in live:
+            continue
+        version = int(filename.rsplit('-', 1)[1].split('.')[0])
+        if version <= manifest['version'] - KEEP_VERSIONS:
+            os.remove(os.path.join(state_dir, filename))
+
+
+def load_component(state_dir, filename, mmap_mode='r'):
+    """Objects of one published component file
+
+    With mmap_mode='r' data arrays are read-only memory maps of the file,
+    shared through the page cache by every process that loads it. A demand
+    model gets a new version, since versions are only unique within one
+    process.
+    """
+    objects = joblib.load(os.path.join(state_dir, filename), mmap_mode=mmap_mode)
+    if objects.get('demand_model') is not None:
+        objects['demand_model'].version = next_model_version()
+    return objects
+
+
+def load_state(state_dir, mmap_mode='r', loaded=None):
+    """Manifest and objects of the published state, (None, {}) if there is none
+
+    loaded maps component names to the files already held by the caller;
+    only components whose file changed are loaded.
+    """
+    manifest = read_manifest(state_dir)
+    if manifest is None:
+        return None, {}
+
+    start = time.perf_counter()
+    loaded = loaded or {}
+    state = {}
+    for name, filename in manifest['components'].items():
+        if loaded.get(name) != filename:
+            state.update(load_component(state_dir, filename, mmap_mode))
+    if state:
+        logger.info("Loaded state version %d (saved %s) in %.3fs",
+                    manifest['version'], manifest['saved_at'], time.perf_counter() - start)
+    return manifest, state
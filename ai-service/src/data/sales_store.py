@@ -0,0 +1,201 @@
+import pandas as pd
+import numpy as np
+import logging
+
+from src.data.ingestion import concat_frames
+from src.models.demand_forecasting.features import product_date_order
+
+logger = logging.getLogger(__name__)
+
+
+class SalesStore:
+    """Sales history sorted by (product_id, date) with a per-product row-range index
+
+    Each product occupies rows starts[i]:ends[i] of `frame`, so per-product
+    slices are views and per-product aggregates are precomputed once.
+    Built from a previous store, products whose rows are unchanged keep their
+    data version; the others get a new one and are listed in changed_products.
+    generation counts the stores in that lineage, so a model trained on one
+    store can tell whether a later upload is already part of its history.
+    """
+
+    def __init__(self, data, previous=None):
+        order, product_ids, counts = product_date_order(data)
+        frame = data.iloc[order].reset_index(drop=True)
+        frame['date'] = pd.to_datetime(frame['date'])
+        self._index(frame, product_ids, counts)
+
+        self._set_summaries(*self._range_sums())
+        self._assign_versions(previous)
+        self.generation = 0 if previous is None else previous.generation + 1
+
+    def _index(self, frame, product_ids, counts):
+        """Take frame, already grouped by product in product_ids order, as the store's rows"""
+        self.frame = frame
+        self.product_ids = np.asarray(product_ids)
+        self.counts = counts
+
+        self.ends = np.cumsum(self.counts)
+        self.starts = self.ends - self.counts
+        self._positions = {product_id: i for i, product_id in enumerate(self.product_ids)}
+
+    def _range_sums(self, positions=None):
+        """Quantity total, valid count and checksum of the given products (all by default)
+
+        Computed from cumulative sums over the rows of those products only.
+        """
+        counts = self.counts if positions is None else self.counts[positions]
+        local_ends = np.cumsum(counts)
+        local_starts = local_ends - counts
+        if positions is None:
+            rows = slice(None)
+        else:
+            # Row numbers of the products' ranges, one range after another
+            rows = np.repeat(self.starts[positions] - local_starts, counts) + np.arange(counts.sum())
+
+        quantity = self.frame['quantity']
+        present = quantity.notna().to_numpy()[rows]
+        if pd.api.types.is_integer_dtype(quantity):
+            values = quantity.to_numpy(dtype=np.int64)[rows]
+        else:
+            values = np.where(present, quantity.to_numpy(dtype=float)[rows], 0.0)
+
+        csum = np.concatenate(([0], np.cumsum(values)))
+        cpresent = np.concatenate(([0], np.cumsum(present)))
+        totals = csum[local_ends] - csum[local_starts]
+        valid = cpresent[local_ends] - cpresent[local_starts]
+
+        # Order-sensitive checksum of each product's rows, used to detect changed history
+        position = np.arange(len(values)) - np.repeat(local_starts, counts)
+        days = self.frame['date'].to_numpy()[rows].astype('datetime64[D]').astype(float)
+        weighted = np.concatenate(([0.0], np.cumsum(values * (position + 1.0) + days)))
+        checksums = weighted[local_ends] - weighted[local_starts]
+        return totals, valid, checksums
+
+    def _set_summaries(self, totals, valid, checksums):
+        """Per-product total, mean, count and date range"""
+        self.totals = totals
+        self.valid = valid
+        self.checksums = checksums
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.means = self.totals / self.valid
+
+        dates = self.frame['date'].to_numpy()
+        self.min_dates = dates[self.starts]
+        self.max_dates = dates[self.ends - 1]
+
+    def _assign_versions(self, previous):
+        """Carry per-product data versions over from previous, bumping changed products"""
+        self.product_versions = np.ones(len(self.product_ids), dtype=np.int64)
+        if previous is None:
+            self.changed_products = list(self.product_ids)
+            return
+
+        prev = pd.Index(previous.product_ids).get_indexer(self.product_ids)
+        known = np.flatnonzero(prev >= 0)
+        p = prev[known]
+        same = ((previous.counts[p] == self.counts[known])
+                & (previous.totals[p] == self.totals[known])
+                & (previous.checksums[p] == self.checksums[known])
+                & (previous.max_dates[p] == self.max_dates[known]))
+
+        self.product_versions[known] = previous.product_versions[p] + ~same
+        unchanged = set(self.product_ids[known[same]])
+        removed = set(previous.product_ids) - set(self.product_ids)
+        self.changed_products = [pid for pid in self.product_ids if pid not in unchanged] + list(removed)
+
+    def __len__(self):
+        return len(self.frame)
+
+    def __contains__(self, product_id):
+        return product_id in self._positions
+
+    def _range(self, product_id):
+        position = self._positions.get(product_id)
+        if position is None:
+            return None
+        return self.starts[position], self.ends[position]
+
+    def product_slice(self, product_id):
+        """Date-ordered rows of one product as a view of the store, None if unknown"""
+        bounds = self._range(product_id)
+        if bounds is None:
+            return None
+        return self.frame.iloc[bounds[0]:bounds[1]]
+
+    def quantities(self, product_id):
+        """Date-ordered quantities of one product as a NumPy view"""
+        bounds = self._range(product_id)
+        if bounds is None:
+            return None
+        return self.frame['quantity'].to_numpy()[bounds[0]:bounds[1]]
+
+    def stats(self, product_id):
+        """Summary statistics for one product without touching other rows"""
+        position = self._positions.get(product_id)
+        if position is None:
+            return None
+
+        return {
+            'product_id': product_id,
+            'total_sales': self.totals[position],
+            'avg_sales': self.means[position],
+            'order_count': int(self.counts[position]),
+            'date_range': {
+                'start': pd.Timestamp(self.min_dates[position]).strftime('%Y-%m-%d'),
+                'end': pd.Timestamp(self.max_dates[position]).strftime('%Y-%m-%d')
+            }
+        }
+
+    def append(self, new_rows):
+        """New store with new_rows merged into the sorted history
+
+        Only the new rows are sorted; they are placed into the product ranges
+        by binary search, and summaries are recomputed just for the products
+        that received rows. Building the new frame still copies the history.
+        """
+        new_rows = new_rows.assign(date=pd.to_datetime(new_rows['date']))
+        combined = concat_frames([self.frame, new_rows])
+        history = len(self.frame)
+
+        # Rows are ordered by one integer key: product rank, then date rank
+        codes, product_ids = pd.factorize(combined['product_id'], sort=True)
+        if np.any(np.diff(codes[:history]) < 0):
+            # Merged categories put the known products in another order
+            return SalesStore(combined, previous=self)
+        date_codes, dates = pd.factorize(combined['date'], sort=True)
+        # Missing dates sort last, as they do in NumPy
+        date_codes = np.where(date_codes < 0, len(dates), date_codes)
+        keys = codes.astype(np.int64) * (len(dates) + 1) + date_codes
+
+        # Rows without a product id belong to no group and are dropped
+        added = history + np.flatnonzero(codes[history:] >= 0)
+        added = added[np.argsort(keys[added], kind='stable')]
+        # After history rows of the same product and day, as a stable sort of both would place them
+        slots = np.searchsorted(keys[:history], keys[added], side='right') + np.arange(len(added))
+        order = np.empty(history + len(added), dtype=np.int64)
+        is_added = np.zeros(len(order), dtype=bool)
+        is_added[slots] = True
+        order[slots] = added
+        order[~is_added] = np.arange(history)
+
+        store = SalesStore.__new__(SalesStore)
+        store._index(combined.iloc[order].reset_index(drop=True), product_ids,
+                     np.bincount(codes[codes >= 0], minlength=len(product_ids)))
+
+        touched = np.unique(codes[added])
+        totals, valid, checksums = store._range_sums(touched)
+        kept = np.ones(len(product_ids), dtype=bool)
+        kept[touched] = False
+        previous = pd.Index(self.product_ids).get_indexer(store.product_ids[kept])
+
+        merged = []
+        for old, new in ((self.totals, totals), (self.valid, valid), (self.checksums, checksums)):
+            values = np.empty(len(product_ids), dtype=np.result_type(old, new))
+            values[kept] = old[previous]
+            values[touched] = new
+            merged.append(values)
+        store._set_summaries(*merged)
+        store._assign_versions(self)
+        store.generation = self.generation + 1
+        return store
@@ -0,0 +1,99 @@
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Objects served together, grouped into the components they are published as
+COMPONENTS = {
+    'demand': ('demand_model',),
+    'sales': ('sales_store', 'demand_cube'),
+    'sustainability': ('sustainability_model', 'sustainability_df')
+}
+FIELDS = tuple(field for fields in COMPONENTS.values() for field in fields)
+
+
+class StateConflict(Exception):
+    """Components changed since the snapshot an update was built from"""
+
+    def __init__(self, components):
+        self.components = list(components)
+        super().__init__(f"{', '.join(self.components)} changed since this update read it")
+
+
+class Snapshot:
+    """Immutable, versioned set of the datasets and models served together
+
+    Neither the snapshot nor the objects it holds are modified once it is
+    created; changes build new objects and a new snapshot. A request takes
+    the current snapshot once and reads every dataset and model from it, so
+    it sees one consistent version without locking. sources maps each
+    published component to the file it was loaded from.
+    """
+
+    __slots__ = ('version', 'sources') + FIELDS
+
+    def __init__(self, version, sources=None, **objects):
+        missing = [field for field in FIELDS if field not in objects]
+        if missing:
+            raise ValueError(f"Snapshot is missing: {', '.join(missing)}")
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, 'sources', dict(sources or {}))
+        for field in FIELDS:
+            object.__setattr__(self, field, objects[field])
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Snapshots are immutable; swap in a new one instead")
+
+    def changed(self, version, sources=None, **changes):
+        """New snapshot with the given objects (and, if given, sources) replaced"""
+        unknown = set(changes) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown snapshot fields: {', '.join(sorted(unknown))}")
+        objects = {field: changes.get(field, getattr(self, field)) for field in FIELDS}
+        return Snapshot(version, self.sources if sources is None else sources, **objects)
+
+
+class SnapshotHolder:
+    """The snapshot being served, replaced atomically by writers
+
+    Reading `current` is a single reference read, so readers never block;
+    writers serialize on a lock so every swap builds on the latest snapshot.
+    """
+
+    def __init__(self, snapshot):
+        self._current = snapshot
+        self._lock = threading.Lock()
+
+    @property
+    def current(self):
+        return self._current
+
+    def swap(self, version=None, base=None, sources=None, **changes):
+        """Serve a snapshot with the given objects replaced; returns it
+
+        Without an explicit version the snapshot gets the next local one.
+        With base, the snapshot the changes were built from, StateConflict is
+        raised instead if a component they replace was swapped since.
+        """
+        with self._lock:
+            old = self._current
+            if base is not None:
+                stale = [name for name in components_of(old, changes)
+                         if any(getattr(old, field) is not getattr(base, field) for field in COMPONENTS[name])]
+                if stale:
+                    raise StateConflict(stale)
+            snapshot = old.changed(old.version + 1 if version is None else version, sources, **changes)
+            self._current = snapshot
+        logger.info("Serving snapshot version %d (%s)", snapshot.version, ', '.join(changes))
+        return snapshot
+
+
+def components_of(snapshot, changes):
+    """Component name -> objects to publish for changes applied to snapshot
+
+    A component is published whole, so objects of a partly changed
+    component are taken from the snapshot.
+    """
+    return {name: {field: changes.get(field, getattr(snapshot, field)) for field in fields}
+            for name, fields in COMPONENTS.items()
+            if any(field in changes for field in fields)}
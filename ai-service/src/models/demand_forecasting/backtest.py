@@ -0,0 +1,175 @@
+import pandas as pd
+import numpy as np
+from sklearn.metrics import mean_absolute_error
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+import argparse
+import itertools
+import json
+import time
+import logging
+
+from .demand_model import DemandForecastingModel
+from .features import DEFAULT_LAGS, DEFAULT_WINDOWS, build_time_series_features
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GRID = {
+    'n_estimators': [50],
+    'max_depth': [None],
+    'features': [(DEFAULT_LAGS, DEFAULT_WINDOWS)]
+}
+
+# Feature frames per (lags, windows) set, shipped once to each worker process
+_worker_features = {}
+
+
+def _init_worker(features):
+    _worker_features.clear()
+    _worker_features.update(features)
+
+
+def rolling_origin_splits(dates, n_folds=3, horizon=30):
+    """Forecast origins of walk-forward folds, oldest first
+
+    Each fold trains on rows dated before its origin and is scored on the
+    following horizon days; the last fold ends at the latest date.
+    """
+    last_day = pd.Timestamp(dates.max()).normalize()
+    return [last_day - pd.Timedelta(days=horizon * k - 1) for k in range(n_folds, 0, -1)]
+
+
+def expand_grid(grid):
+    """One configuration dict per combination of the grid values"""
+    grid = {**DEFAULT_GRID, **grid}
+    return [{'n_estimators': trees, 'max_depth': depth, 'lags': tuple(lags), 'windows': tuple(windows)}
+            for trees, depth, (lags, windows)
+            in itertools.product(grid['n_estimators'], grid['max_depth'], grid['features'])]
+
+
+def evaluate_fold(config, origin, horizon):
+    """Fit one configuration on rows before origin and score its forecast of the next horizon days"""
+    processed = _worker_features[(config['lags'], config['windows'])]
+    dates = processed['date'].to_numpy()
+    history = processed[dates < origin.to_datetime64()]
+    actual = processed[(dates >= origin.to_datetime64())
+                       & (dates < (origin + pd.Timedelta(days=horizon)).to_datetime64())]
+
+    model = DemandForecastingModel(config['lags'], config['windows'],
+                                   n_estimators=config['n_estimators'], max_depth=config['max_depth'])
+    start = time.perf_counter()
+    model.train_on_features(history)
+    fit_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    # Every product is forecast over the same days, from the origin on
+    forecast = model.predict(history, days=horizon, start=origin)
+    predict_seconds = time.perf_counter() - start
+
+    # Score every forecast day: sales summed per product and day, 0 on days without sales
+    actual = (actual.assign(date=actual['date'].dt.strftime('%Y-%m-%d'))
+              .groupby(['product_id', 'date'], observed=True)['quantity'].sum().rename('actual'))
+    scored = forecast.join(actual, on=['product_id', 'date'], how='left')
+    sales_days = int(scored['actual'].notna().sum())
+    scored['actual'] = scored['actual'].fillna(0)
+
+    return {
+        'origin': origin.strftime('%Y-%m-%d'),
+        'train_rows': len(history),
+        'test_rows': len(scored),
+        'sales_days': sales_days,
+        'mae': float(mean_absolute_error(scored['actual'], scored['predicted_quantity'])) if len(scored) else None,
+        'fit_seconds': fit_seconds,
+        'predict_seconds': predict_seconds
+    }
+
+
+def backtest(data, grid=None, n_folds=3, horizon=30, max_workers=None, mp_context=None):
+    """Walk-forward backtest of every grid configuration
+
+    Features are built once per lag/window set and reused by every fold and
+    configuration; (configuration, fold) pairs are evaluated across a
+    process pool. Returns one summary per configuration, best MAE first.
+    """
+    configs = expand_grid(grid or {})
+    features = {}
+    for config in configs:
+        key = (config['lags'], config['windows'])
+        if key not in features:
+            features[key] = build_time_series_features(data, *key)
+
+    origins = rolling_origin_splits(data['date'], n_folds, horizon)
+    context = multiprocessing.get_context(mp_context) if mp_context else None
+    folds = {i: [] for i in range(len(configs))}
+
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context,
+                             initializer=_init_worker, initargs=(features,)) as pool:
+        futures = {pool.submit(evaluate_fold, config, origin, horizon): i
+                   for i, config in enumerate(configs) for origin in origins}
+        for future in as_completed(futures):
+            folds[futures[future]].append(future.result())
+
+    results = []
+    for i, config in enumerate(configs):
+        runs = sorted(folds[i], key=lambda run: run['origin'])
+        maes = [run['mae'] for run in runs if run['mae'] is not None]
+        results.append({
+            **config,
+            'mae': float(np.mean(maes)) if maes else None,
+            'mae_std': float(np.std(maes)) if maes else None,
+            'fit_seconds': float(np.mean([run['fit_seconds'] for run in runs])),
+            'predict_seconds': float(np.mean([run['predict_seconds'] for run in runs])),
+            'folds': runs
+        })
+
+    return sorted(results, key=lambda result: (result['mae'] is None, result['mae']))
+
+
+def _int_list(text):
+    return tuple(int(value) for value in text.split(','))
+
+
+def _depth(text):
+    return None if text.lower() in ('none', '0') else int(text)
+
+
+def main(argv=None):
+    from src.data.ingestion import SALES_SCHEMA, ingest_csv
+
+    parser = argparse.ArgumentParser(description="Walk-forward backtest of demand forecasting settings")
+    parser.add_argument('sales_csv', help="Sales CSV with ProductID, Date and QuantitySold columns")
+    parser.add_argument('--folds', type=int, default=3)
+    parser.add_argument('--horizon', type=int, default=30, help="Forecast days per fold")
+    parser.add_argument('--trees', type=int, nargs='+', default=DEFAULT_GRID['n_estimators'])
+    parser.add_argument('--depth', type=_depth, nargs='+', default=DEFAULT_GRID['max_depth'],
+                        help="Maximum tree depths; 'none' for unlimited")
+    parser.add_argument('--lags', type=_int_list, nargs='+', default=[DEFAULT_LAGS],
+                        help="Comma-separated lag sets, e.g. 7,30 1,7,14")
+    parser.add_argument('--windows', type=_int_list, nargs='+', default=[DEFAULT_WINDOWS],
+                        help="Comma-separated rolling window sets")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', help="Write the JSON results to this file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    data, _ = ingest_csv(args.sales_csv, SALES_SCHEMA)
+    grid = {
+        'n_estimators': args.trees,
+        'max_depth': args.depth,
+        'features': list(itertools.product(args.lags, args.windows))
+    }
+    results = backtest(data, grid, n_folds=args.folds, horizon=args.horizon, max_workers=args.workers)
+
+    for result in results:
+        mae = 'n/a' if result['mae'] is None else f"{result['mae']:.3f}"
+        logger.info("trees=%s depth=%s lags=%s windows=%s  MAE %s  fit %.2fs  predict %.3fs",
+                    result['n_estimators'], result['max_depth'], result['lags'], result['windows'],
+                    mae, result['fit_seconds'], result['predict_seconds'])
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+import numpy as np
+
+# sklearn's child index of leaves
+TREE_LEAF = -1
+# (row, tree) walks evaluated together, bounding inference memory on large batches
+BLOCK_WALKS = 2_000_000
+# Tree levels advanced between dropping the walks that reached a leaf
+COMPACT_EVERY = 4
+
+
+class CompiledForest:
+    """Fitted StandardScaler and RandomForestRegressor as flat NumPy node arrays
+
+    The nodes of all trees are concatenated, each with a split feature, a
+    threshold, its (right, left) children and a value. Leaves split on
+    feature 0 at +inf and are their own children, so a walk that reaches a
+    leaf stays there. Inference advances every (row, tree) walk one level
+    per vectorized step, which avoids sklearn's per-call validation and
+    dispatch. Inputs are scaled in float64 and cast to float32 as sklearn
+    does, and thresholds are stored as the largest float32 not above the
+    float64 threshold, so every split goes the same way and the predictions
+    equal sklearn's.
+    """
+
+    ARRAYS = ('mean', 'scale', 'feature', 'threshold', 'children', 'value', 'roots')
+
+    def __init__(self, mean, scale, feature, threshold, children, value, roots):
+        self.mean = mean
+        self.scale = scale
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self._leaf = children[1::2] == np.arange(len(feature))
+
+    @classmethod
+    def from_estimators(cls, scaler, forest):
+        """Compile a fitted scaler and forest"""
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+        sizes = np.array([tree.node_count for tree in trees])
+        roots = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+
+        feature, threshold, children, value = [], [], [], []
+        for root, tree in zip(roots, trees):
+            leaf = tree.children_left == TREE_LEAF
+            nodes = np.arange(tree.node_count)
+            pairs = np.empty((tree.node_count, 2), dtype=np.int64)
+            pairs[:, 0] = np.where(leaf, nodes, tree.children_right)
+            pairs[:, 1] = np.where(leaf, nodes, tree.children_left)
+            children.append((pairs + root).ravel())
+            feature.append(np.where(leaf, 0, tree.feature))
+            threshold.append(np.where(leaf, np.float32(np.inf), _float32_floor(tree.threshold)))
+            value.append(tree.value[:, 0, 0])
+
+        return cls(
+            mean=np.asarray(scaler.mean_, dtype=np.float64),
+            scale=np.asarray(scaler.scale_, dtype=np.float64),
+            feature=np.concatenate(feature).astype(np.int16),
+            threshold=np.concatenate(threshold).astype(np.float32),
+            children=np.concatenate(children).astype(np.int32),
+            value=np.concatenate(value).astype(np.float64),
+            roots=roots.astype(np.int32)
+        )
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def transform(self, X):
+        """Scale raw feature rows and cast them to the float32 the trees split on"""
+        X = np.asarray(X, dtype=np.float64)
+        return ((X - self.mean) / self.scale).astype(np.float32)
+
+    def _leaves(self, X):
+        """Leaf node reached by every scaled row in every tree, shape (rows, trees)"""
+        n_rows, n_features = X.shape
+        flat = X.ravel()
+        leaves = np.empty(n_rows * self.n_trees, dtype=np.intp)
+
+        node = np.tile(self.roots.astype(np.intp), n_rows)
+        row_start = np.repeat(np.arange(n_rows, dtype=np.intp) * n_features, self.n_trees)
+        walk = np.arange(len(node))
+        while node.size:
+            for _ in range(COMPACT_EVERY):
+                go_left = flat[row_start + self.feature[node]] <= self.threshold[node]
+                node = self.children[2 * node + go_left]
+            # Drop finished walks so deeper levels only advance the rest
+            done = self._leaf[node]
+            leaves[walk[done]] = node[done]
+            node, row_start, walk = node[~done], row_start[~done], walk[~done]
+
+        return leaves.reshape(n_rows, self.n_trees)
+
+    def iter_tree_predictions(self, X):
+        """Yield (start row, per-tree predictions) for consecutive blocks of rows"""
+        X = self.transform(np.atleast_2d(X))
+        block_rows = max(1, BLOCK_WALKS // self.n_trees)
+        for start in range(0, len(X), block_rows):
+            yield start, self.value[self._leaves(X[start:start + block_rows])]
+
+    def tree_predictions(self, X):
+        """Prediction of every tree for every row, shape (rows, trees)"""
+        blocks = [per_tree for _, per_tree in self.iter_tree_predictions(X)]
+        return np.concatenate(blocks) if blocks else np.empty((0, self.n_trees))
+
+    def predict(self, X):
+        """Forest predictions of raw (unscaled) feature rows"""
+        X = np.atleast_2d(X)
+        predictions = np.empty(len(X))
+        for start, per_tree in self.iter_tree_predictions(X):
+            predictions[start:start + len(per_tree)] = mean_of_trees(per_tree)
+        return predictions
+
+    def to_arrays(self):
+        """Node and scaler arrays by name, for np.savez"""
+        return {name: getattr(self, name) for name in self.ARRAYS}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Rebuild from the arrays of to_arrays (or a loaded .npz)"""
+        return cls(**{name: arrays[name] for name in cls.ARRAYS})
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.to_arrays().values())
+
+
+def mean_of_trees(per_tree):
+    """Forest prediction from per-tree predictions of shape (rows, trees)
+
+    Trees are summed in order, as sklearn accumulates them, so the result
+    equals RandomForestRegressor.predict exactly.
+    """
+    total = np.zeros(len(per_tree))
+    for tree in range(per_tree.shape[1]):
+        total += per_tree[:, tree]
+    return total / per_tree.shape[1]
+
+
+def _float32_floor(threshold):
+    """Largest float32 not above each float64 threshold
+
+    For float32 inputs x, x <= threshold exactly when x <= this value.
+    """
+    rounded = threshold.astype(np.float32)
+    above = rounded.astype(np.float64) > threshold
+    rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+    return rounded
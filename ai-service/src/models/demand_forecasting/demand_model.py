@@ -4,140 +4,309 @@ from sklearn.ensemble import RandomForestRegressor
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import mean_absolute_error
 import joblib
-from datetime import datetime, timedelta
+from datetime import datetime
+import itertools
 import logging
 
+from .compiled_forest import BLOCK_WALKS, CompiledForest, mean_of_trees
+from .features import (DEFAULT_LAGS, DEFAULT_WINDOWS, FeatureState,
+                       build_time_series_features, feature_columns, product_date_order)
+
+from src.data.demand_cube import DemandCube
+from src.data.sales_store import SalesStore
+from src.utils.metrics import timed
+
 logger = logging.getLogger(__name__)
 
+# Batches up to this many rows go through the compiled forest; beyond it sklearn's
+# C traversal outweighs its per-call overhead
+COMPILED_MAX_ROWS = 2000
+
+# Process-wide so a retrained or reloaded model never reuses a cached version
+_model_versions = itertools.count(1)
+
+
+def next_model_version():
+    """New process-unique model version"""
+    return next(_model_versions)
+
+
+def normalize_quantiles(quantiles):
+    """Sorted, distinct quantiles from a list or comma-separated string of fractions in [0, 1]"""
+    if quantiles is None or quantiles == '':
+        return ()
+    if isinstance(quantiles, str):
+        quantiles = quantiles.split(',')
+    try:
+        values = sorted({float(q) for q in quantiles})
+    except (TypeError, ValueError):
+        raise ValueError("quantiles must be numbers between 0 and 1")
+    if any(not 0 <= q <= 1 for q in values):
+        raise ValueError("quantiles must be numbers between 0 and 1")
+    return tuple(values)
+
+
+def quantile_column(quantile):
+    """Forecast column of a quantile: 0.1 -> p10, 0.025 -> p2.5"""
+    return f'p{quantile * 100:.10g}'
+
 class DemandForecastingModel:
     """Simple demand forecasting model for retail analytics"""
     
-    def __init__(self):
-        self.model = RandomForestRegressor(n_estimators=50, random_state=42)
+    def __init__(self, lags=DEFAULT_LAGS, windows=DEFAULT_WINDOWS, n_jobs=None,
+                 n_estimators=50, max_depth=None):
+        self.model = RandomForestRegressor(n_estimators=n_estimators, max_depth=max_depth,
+                                           random_state=42, n_jobs=n_jobs)
         self.scaler = StandardScaler()
+        self.lags = tuple(lags)
+        self.windows = tuple(windows)
+        self.feature_cols = feature_columns(self.lags, self.windows)
+        self.feature_state = FeatureState(self.lags, self.windows)
+        self._X = np.empty((0, len(self.feature_cols)))
+        self._y = np.empty(0)
+        self.compiled = None
+        self.version = 0
         self.is_trained = False
         
     def prepare_features(self, data):
-        """Create basic features for demand forecasting"""
-        df = data.copy()
-        df['date'] = pd.to_datetime(df['date'])
-        
-        # Basic time features
-        df['day_of_week'] = df['date'].dt.dayofweek
-        df['month'] = df['date'].dt.month
-        df['is_weekend'] = df['day_of_week'].isin([5, 6]).astype(int)
+        """Create lag and rolling-window features for demand forecasting"""
+        with timed('demand', 'features', rows=len(data)):
+            return build_time_series_features(data, self.lags, self.windows)
+    
+    def train(self, data, progress=None):
+        """Train the demand forecasting model
         
-        # Lag features
-        df['quantity_lag_7'] = df.groupby('product_id')['quantity'].shift(7)
-        df['quantity_lag_30'] = df.groupby('product_id')['quantity'].shift(30)
+        progress, if given, is called as progress(fraction, stage) between steps.
+        """
+        progress = progress or (lambda fraction, stage=None: None)
+        if isinstance(data, SalesStore):
+            data = data.frame
+        progress(0.05, 'features')
+        processed_data = self.prepare_features(data)
         
-        # Rolling averages
-        df['quantity_avg_7'] = df.groupby('product_id')['quantity'].rolling(7).mean().reset_index(0, drop=True)
-        df['quantity_avg_30'] = df.groupby('product_id')['quantity'].rolling(30).mean().reset_index(0, drop=True)
+        progress(0.3, 'fit')
+        return self.train_on_features(processed_data)
+    
+    def train_on_features(self, processed_data):
+        """Train on rows already passed through prepare_features"""
+        # Keep the training matrix and rolling state so appended sales can extend them
+        self.feature_state = FeatureState.from_features(processed_data, self.lags, self.windows)
+        self._X, self._y = self._training_matrix(processed_data)
         
-        # Fill missing values
-        df = df.fillna(0)
+        self._fit()
         
-        return df
+        return {"status": "trained", "samples": len(self._X)}
     
-    def train(self, data):
-        """Train the demand forecasting model"""
-        processed_data = self.prepare_features(data)
+    def update(self, new_rows):
+        """Extend the training set with appended sales rows and refit
         
-        # Select features
-        feature_cols = ['day_of_week', 'month', 'is_weekend', 'quantity_lag_7', 
-                       'quantity_lag_30', 'quantity_avg_7', 'quantity_avg_30']
+        Only the new rows go through feature generation; their lags and rolling
+        means come from the per-product state kept since the last train.
+        """
+        if not self.is_trained:
+            raise ValueError("Model not trained")
+        if not len(self._X):
+            raise ValueError("No stored training matrix; full retrain required")
         
-        X = processed_data[feature_cols]
-        y = processed_data['quantity']
+        processed_data = self.feature_state.update(new_rows)
+        X, y = self._training_matrix(processed_data)
         
-        # Remove rows with NaN values
-        mask = ~(X.isna().any(axis=1) | y.isna())
-        X = X[mask]
-        y = y[mask]
+        self._X = np.concatenate([self._X, X])
+        self._y = np.concatenate([self._y, y])
+        self._fit()
         
-        # Scale features
-        X_scaled = self.scaler.fit_transform(X)
+        return {"status": "updated", "samples": len(self._X), "new_samples": len(X)}
+    
+    def _training_matrix(self, processed_data):
+        """Feature matrix and target for rows with complete values"""
+        X = processed_data[self.feature_cols].to_numpy(dtype=float)
+        y = processed_data['quantity'].to_numpy(dtype=float)
         
-        # Train model
-        self.model.fit(X_scaled, y)
+        # Remove rows with NaN values
+        mask = ~(np.isnan(X).any(axis=1) | np.isnan(y))
+        return X[mask], y[mask]
+    
+    def _fit(self):
+        """Fit the scaler and forest on the stored training matrix"""
+        rows = len(self._X)
+        with timed('demand', 'scale', rows=rows):
+            X_scaled = self.scaler.fit_transform(pd.DataFrame(self._X, columns=self.feature_cols))
+        with timed('demand', 'fit', rows=rows):
+            self.model.fit(X_scaled, self._y)
+        with timed('demand', 'compile'):
+            self.compile()
+        self.version = next_model_version()
         self.is_trained = True
+    
+    def predict(self, data, days=30, product_ids=None, quantiles=None, start=None):
+        """Make demand predictions for every product in a sales frame or SalesStore
         
-        return {"status": "trained", "samples": len(X)}
+        product_ids restricts the forecast to a subset of the products in data.
+        quantiles (fractions, e.g. (0.1, 0.5, 0.9)) add a column per quantile,
+        such as p10, taken over the predictions of the individual trees.
+        Each product's forecast starts the day after its last sale, or on the
+        start date for all products if one is given.
+        """
+        if not self.is_trained:
+            raise ValueError("Model not trained")
+        return self.predict_from_stats(self._recent_window_stats(data), days, product_ids, quantiles, start)
     
-    def predict(self, data, days=30):
-        """Make demand predictions"""
+    def predict_from_stats(self, stats, days=30, product_ids=None, quantiles=None, start=None):
+        """predict() from per-product stats already computed by _recent_window_stats
+        
+        Lets models sharing lags and windows forecast from one pass over the sales.
+        """
         if not self.is_trained:
             raise ValueError("Model not trained")
+        quantiles = normalize_quantiles(quantiles)
+        
+        all_products, last_dates, window_means = stats
+        if product_ids is None:
+            product_ids = all_products
+        else:
+            selected = pd.Index(all_products).get_indexer(product_ids)
+            selected = selected[selected >= 0]
+            product_ids = all_products[selected]
+            last_dates = last_dates[selected]
+            window_means = {span: means[selected] for span, means in window_means.items()}
+        with timed('demand', 'forecast_features', products=len(product_ids)):
+            future_dates, X = self._build_forecast_features(last_dates, window_means, days, start)
+        
+        if quantiles:
+            with timed('demand', 'predict_quantiles', rows=len(X), products=len(product_ids)):
+                preds, bands = self._predict_quantiles_matrix(X, quantiles)
+        else:
+            with timed('demand', 'predict', rows=len(X), products=len(product_ids)):
+                preds = self._predict_matrix(X)
+        
+        predictions = pd.DataFrame({
+            'product_id': np.repeat(product_ids, days),
+            'date': future_dates.strftime('%Y-%m-%d'),
+            'predicted_quantity': np.maximum(0, np.round(preds, 2))
+        })
+        for i, quantile in enumerate(quantiles):
+            predictions[quantile_column(quantile)] = np.maximum(0, np.round(bands[:, i], 2))
+        return predictions
+    
+    def compile(self):
+        """Compile the fitted scaler and forest into flat node arrays for inference"""
+        self.compiled = CompiledForest.from_estimators(self.scaler, self.model)
+        return self.compiled
+    
+    def _predict_matrix(self, X):
+        """Predictions for raw feature rows, through the compiled forest for small batches"""
+        fitted = hasattr(self.model, 'estimators_')
+        if self.compiled is not None and (len(X) <= COMPILED_MAX_ROWS or not fitted):
+            return self.compiled.predict(X)
+        
+        # Scale and predict every (product, day) row in one call
+        X_scaled = self.scaler.transform(pd.DataFrame(X, columns=self.feature_cols))
+        return self.model.predict(X_scaled)
+    
+    def _iter_tree_predictions(self, X):
+        """Yield (start row, per-tree predictions) for blocks of raw feature rows
+        
+        Follows the routing of _predict_matrix: the compiled forest for small
+        batches, otherwise one scaling pass and sklearn's trees per block.
+        """
+        fitted = hasattr(self.model, 'estimators_')
+        if self.compiled is not None and (len(X) <= COMPILED_MAX_ROWS or not fitted):
+            yield from self.compiled.iter_tree_predictions(X)
+            return
+        
+        X_scaled = self.scaler.transform(pd.DataFrame(X, columns=self.feature_cols))
+        # Trees split on float32, as the forest's own predict converts to
+        X_scaled = np.ascontiguousarray(X_scaled, dtype=np.float32)
+        trees = self.model.estimators_
+        block_rows = max(1, BLOCK_WALKS // len(trees))
+        for start in range(0, len(X_scaled), block_rows):
+            block = X_scaled[start:start + block_rows]
+            yield start, np.column_stack([tree.predict(block, check_input=False) for tree in trees])
+    
+    def _predict_quantiles_matrix(self, X, quantiles):
+        """Point predictions and per-tree quantiles, shape (rows, quantiles), in one pass over the trees"""
+        preds = np.empty(len(X))
+        bands = np.empty((len(X), len(quantiles)))
+        for start, per_tree in self._iter_tree_predictions(X):
+            stop = start + len(per_tree)
+            preds[start:stop] = mean_of_trees(per_tree)
+            bands[start:stop] = np.quantile(per_tree, quantiles, axis=1).T
+        return preds, bands
+    
+    def _recent_window_stats(self, data):
+        """Per-product last sale date and recent-window quantity means in one grouped pass"""
+        if isinstance(data, SalesStore):
+            # Already grouped and date-sorted, products in sorted order
+            product_ids, counts = data.product_ids, data.counts
+            dates = data.frame['date'].to_numpy()
+            quantities = data.frame['quantity'].to_numpy(dtype=float)
+        else:
+            # Products keep their order of first appearance, matching data['product_id'].unique()
+            order, product_ids, counts = product_date_order(data, sort_products=False)
+            dates = pd.to_datetime(data['date']).to_numpy()[order]
+            quantities = data['quantity'].to_numpy(dtype=float)[order]
+        
+        ends = np.cumsum(counts)
+        last_dates = pd.DatetimeIndex(dates[ends - 1])
+        # Missing quantities are skipped, as pandas mean does, so they never leak
+        # into the running sums of other products
+        missing = np.isnan(quantities)
+        csum = np.concatenate(([0.0], np.cumsum(np.where(missing, 0.0, quantities))))
+        cvalid = np.concatenate(([0], np.cumsum(~missing)))
         
-        predictions = []
-        
-        for product_id in data['product_id'].unique():
-            product_data = data[data['product_id'] == product_id].sort_values('date')
-            
-            # Get last 30 days for features
-            recent_data = product_data.tail(30)
-            
-            for i in range(days):
-                # Create future date
-                last_date = product_data['date'].max()
-                future_date = last_date + timedelta(days=i+1)
-                
-                # Create features for prediction
-                features = [
-                    future_date.weekday(),  # day_of_week
-                    future_date.month,      # month
-                    1 if future_date.weekday() >= 5 else 0,  # is_weekend
-                    recent_data['quantity'].iloc[-7:].mean() if len(recent_data) >= 7 else 0,  # lag_7
-                    recent_data['quantity'].mean(),  # lag_30
-                    recent_data['quantity'].iloc[-7:].mean() if len(recent_data) >= 7 else 0,  # avg_7
-                    recent_data['quantity'].mean()   # avg_30
-                ]
-                
-                # Make prediction
-                features_scaled = self.scaler.transform([features])
-                pred = self.model.predict(features_scaled)[0]
-                
-                predictions.append({
-                    'product_id': product_id,
-                    'date': future_date.strftime('%Y-%m-%d'),
-                    'predicted_quantity': max(0, round(pred, 2))
-                })
-        
-        return pd.DataFrame(predictions)
+        # Shorter spans need a full window of history, the longest uses what is available
+        spans = sorted(set(self.lags) | set(self.windows))
+        window_means = {}
+        for span in spans:
+            size = np.minimum(counts, span)
+            valid = cvalid[ends] - cvalid[ends - size]
+            # A window with no quantity at all has no mean
+            with np.errstate(invalid='ignore', divide='ignore'):
+                means = np.where(valid > 0, (csum[ends] - csum[ends - size]) / valid, np.nan)
+            window_means[span] = means if span == spans[-1] else np.where(counts >= span, means, 0.0)
+        
+        return product_ids, last_dates, window_means
+    
+    def _build_forecast_features(self, last_dates, window_means, days, start=None):
+        """Build the (products x days) feature matrix for the forecast horizon"""
+        if start is None:
+            first_dates = last_dates.to_numpy() + np.timedelta64(1, 'D')
+        else:
+            first_dates = np.full(len(last_dates), pd.Timestamp(start).normalize().to_datetime64())
+        offsets = pd.to_timedelta(np.arange(days), unit='D').to_numpy()
+        future_dates = pd.DatetimeIndex((first_dates[:, None] + offsets).ravel())
+        
+        day_of_week = future_dates.dayofweek.to_numpy()
+        columns = [
+            day_of_week,
+            future_dates.month.to_numpy(),
+            (day_of_week >= 5).astype(int)
+        ]
+        # Future lags and rolling means are both approximated by the recent-window mean
+        columns += [np.repeat(window_means[lag], days) for lag in self.lags]
+        columns += [np.repeat(window_means[window], days) for window in self.windows]
+        
+        return future_dates, np.column_stack(columns).astype(float)
     
     def analyze_demand(self, data):
-        """Analyze demand patterns"""
-        df = data.copy()
-        df['date'] = pd.to_datetime(df['date'])
-        
-        # Product performance
-        product_stats = df.groupby('product_id')['quantity'].agg(['sum', 'mean', 'count']).round(2)
-        product_stats.columns = ['total_sales', 'avg_sales', 'order_count']
-        
-        # Time patterns
-        daily_sales = df.groupby(df['date'].dt.date)['quantity'].sum()
-        monthly_sales = df.groupby(df['date'].dt.month)['quantity'].sum()
-        
-        # Top/bottom products
-        top_products = product_stats.sort_values('total_sales', ascending=False).head(10)
-        bottom_products = product_stats.sort_values('total_sales', ascending=True).head(10)
-        
-        return {
-            'product_stats': product_stats.to_dict('index'),
-            'top_products': top_products.to_dict('index'),
-            'bottom_products': bottom_products.to_dict('index'),
-            'daily_avg': daily_sales.mean(),
-            'monthly_totals': monthly_sales.to_dict(),
-            'total_orders': len(df),
-            'unique_products': df['product_id'].nunique()
-        }
+        """Analyze demand patterns from a sales frame, SalesStore or prebuilt DemandCube"""
+        if isinstance(data, SalesStore):
+            data = data.frame
+        with timed('demand', 'analyze'):
+            cube = data if isinstance(data, DemandCube) else DemandCube.from_frame(data)
+            return cube.analysis()
     
     def save_model(self, path):
         """Save the trained model"""
         joblib.dump({
             'model': self.model,
             'scaler': self.scaler,
+            'lags': self.lags,
+            'windows': self.windows,
+            'feature_state': self.feature_state,
+            'X': self._X,
+            'y': self._y,
+            'compiled': self.compiled.to_arrays() if self.compiled is not None else None,
             'is_trained': self.is_trained
         }, path)
     
@@ -146,4 +315,40 @@ class DemandForecastingModel:
         saved_data = joblib.load(path)
         self.model = saved_data['model']
         self.scaler = saved_data['scaler']
-        self.is_trained = saved_data['is_trained']
\ No newline at end of file
+        self.lags = tuple(saved_data.get('lags', DEFAULT_LAGS))
+        self.windows = tuple(saved_data.get('windows', DEFAULT_WINDOWS))
+        self.feature_cols = feature_columns(self.lags, self.windows)
+        # Older saves carry no incremental state, so update() requires a fresh train
+        self.feature_state = saved_data.get('feature_state', FeatureState(self.lags, self.windows))
+        self._X = saved_data.get('X', np.empty((0, len(self.feature_cols))))
+        self._y = saved_data.get('y', np.empty(0))
+        self.is_trained = saved_data['is_trained']
+        if saved_data.get('compiled') is not None:
+            self.compiled = CompiledForest.from_arrays(saved_data['compiled'])
+        elif self.is_trained:
+            self.compile()
+        self.version = next_model_version()
+    
+    def export_compiled(self, path):
+        """Save only what inference needs: the compiled forest and feature settings
+        
+        Much smaller and faster to load than save_model's pickle of the estimators;
+        a model loaded from it can predict but must be retrained to update.
+        """
+        if self.compiled is None:
+            raise ValueError("Model not trained")
+        np.savez(path, lags=np.array(self.lags), windows=np.array(self.windows),
+                 **self.compiled.to_arrays())
+    
+    def load_compiled(self, path):
+        """Load a model exported with export_compiled"""
+        with np.load(path) as saved_data:
+            self.lags = tuple(int(lag) for lag in saved_data['lags'])
+            self.windows = tuple(int(window) for window in saved_data['windows'])
+            self.compiled = CompiledForest.from_arrays(saved_data)
+        self.feature_cols = feature_columns(self.lags, self.windows)
+        self.feature_state = FeatureState(self.lags, self.windows)
+        self._X = np.empty((0, len(self.feature_cols)))
+        self._y = np.empty(0)
+        self.version = next_model_version()
+        self.is_trained = True
\ No newline at end of file
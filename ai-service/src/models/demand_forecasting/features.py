@@ -0,0 +1,147 @@
+import pandas as pd
+import numpy as np
+
+DEFAULT_LAGS = (7, 30)
+DEFAULT_WINDOWS = (7, 30)
+TIME_FEATURES = ['day_of_week', 'month', 'is_weekend']
+
+
+def feature_columns(lags=DEFAULT_LAGS, windows=DEFAULT_WINDOWS):
+    """Model feature column names for a lag/window configuration"""
+    return (TIME_FEATURES
+            + [f'quantity_lag_{lag}' for lag in lags]
+            + [f'quantity_avg_{window}' for window in windows])
+
+
+def product_date_order(data, sort_products=True):
+    """Row order that groups data by product and sorts each group by date
+
+    Returns (order, product_ids, counts): rows of product_ids[i] occupy the
+    i-th contiguous run of length counts[i] in data.iloc[order].
+    """
+    codes, product_ids = pd.factorize(data['product_id'], sort=sort_products)
+    dates = pd.to_datetime(data['date']).to_numpy()
+
+    # Rows without a product id belong to no group and are dropped
+    valid = np.flatnonzero(codes >= 0)
+    order = valid[np.lexsort((dates[valid], codes[valid]))]
+    counts = np.bincount(codes[valid], minlength=len(product_ids))
+
+    return order, np.asarray(product_ids), counts
+
+
+def add_time_features(df):
+    """Add calendar features derived from the date column in place"""
+    df['day_of_week'] = df['date'].dt.dayofweek
+    df['month'] = df['date'].dt.month
+    df['is_weekend'] = df['day_of_week'].isin([5, 6]).astype(int)
+    return df
+
+
+def lag_feature(quantities, position, lag):
+    """Quantity `lag` rows earlier within the same product, 0 where history is short"""
+    out = np.zeros(len(quantities))
+    rows = np.flatnonzero(position >= lag)
+    out[rows] = quantities[rows - lag]
+    return np.nan_to_num(out)
+
+
+def rolling_mean_feature(quantities, position, window):
+    """Trailing mean over `window` rows within the same product, 0 until the window is full
+
+    Uses cumulative sums over the whole array; windows never cross a product
+    boundary because they are only evaluated once `window` rows of the same
+    product are available.
+    """
+    missing = np.isnan(quantities)
+    csum = np.concatenate(([0.0], np.cumsum(np.where(missing, 0.0, quantities))))
+    cmissing = np.concatenate(([0], np.cumsum(missing)))
+
+    out = np.zeros(len(quantities))
+    end = np.flatnonzero(position >= window - 1) + 1
+    # A window containing a missing quantity has no mean, as with pandas rolling
+    complete = cmissing[end] == cmissing[end - window]
+    end = end[complete]
+    out[end - 1] = (csum[end] - csum[end - window]) / window
+    return out
+
+
+def build_time_series_features(data, lags=DEFAULT_LAGS, windows=DEFAULT_WINDOWS):
+    """Sort by (product_id, date) and compute all lag and rolling features in one pass"""
+    order, _, counts = product_date_order(data)
+    df = data.iloc[order].reset_index(drop=True)
+    df['date'] = pd.to_datetime(df['date'])
+
+    # Position of each row within its product run
+    starts = np.cumsum(counts) - counts
+    position = np.arange(len(df)) - np.repeat(starts, counts)
+    quantities = df['quantity'].to_numpy(dtype=float)
+
+    add_time_features(df)
+
+    for lag in lags:
+        df[f'quantity_lag_{lag}'] = lag_feature(quantities, position, lag)
+    for window in windows:
+        df[f'quantity_avg_{window}'] = rolling_mean_feature(quantities, position, window)
+
+    df['quantity'] = df['quantity'].fillna(0)
+
+    return df
+
+
+class FeatureState:
+    """Per-product rolling state for computing features of appended sales rows
+
+    Keeps the last `history` sales of every product, which is all the lag and
+    rolling-window features of a later row can depend on.
+    """
+
+    def __init__(self, lags=DEFAULT_LAGS, windows=DEFAULT_WINDOWS):
+        self.lags = tuple(lags)
+        self.windows = tuple(windows)
+        self.history = max(self.lags + self.windows)
+        self.tail = pd.DataFrame({'product_id': pd.Series(dtype=object),
+                                  'date': pd.Series(dtype='datetime64[ns]'),
+                                  'quantity': pd.Series(dtype=float)})
+
+    @classmethod
+    def from_features(cls, processed, lags=DEFAULT_LAGS, windows=DEFAULT_WINDOWS):
+        """Build the state from the output of build_time_series_features"""
+        state = cls(lags, windows)
+        state.tail = state._last_rows(processed)
+        return state
+
+    def _last_rows(self, df):
+        """Last `history` rows of every product in a (product_id, date)-sorted frame"""
+        rows_from_end = df.groupby('product_id', sort=False, observed=True).cumcount(ascending=False)
+        tail = df.loc[rows_from_end.to_numpy() < self.history, ['product_id', 'date', 'quantity']]
+        return tail.reset_index(drop=True)
+
+    def update(self, new_rows):
+        """Compute features for new_rows only and advance the per-product state
+
+        Rows must not predate the latest sale already seen for their product;
+        backfilled history needs a full rebuild.
+        """
+        new_rows = new_rows.copy()
+        new_rows['date'] = pd.to_datetime(new_rows['date'])
+
+        touched = self.tail['product_id'].isin(new_rows['product_id'].unique())
+        history = self.tail[touched.to_numpy()]
+
+        last_dates = history.groupby('product_id', sort=False, observed=True)['date'].max()
+        known_products = pd.Index(np.asarray(last_dates.index, dtype=object))
+        positions = known_products.get_indexer(np.asarray(new_rows['product_id'], dtype=object))
+        seen = positions >= 0
+        if (new_rows['date'].to_numpy()[seen] < last_dates.to_numpy()[positions[seen]]).any():
+            raise ValueError("Appended sales predate existing history; full retrain required")
+
+        combined = pd.concat([history.assign(_is_new=False), new_rows.assign(_is_new=True)],
+                             ignore_index=True)
+        processed = build_time_series_features(combined, self.lags, self.windows)
+
+        self.tail = pd.concat([self.tail[~touched.to_numpy()], self._last_rows(processed)],
+                              ignore_index=True)
+
+        new_features = processed[processed['_is_new'].to_numpy(dtype=bool)]
+        return new_features.drop(columns='_is_new').reset_index(drop=True)
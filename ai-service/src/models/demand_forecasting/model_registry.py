@@ -0,0 +1,173 @@
+import pandas as pd
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+import joblib
+import logging
+
+from src.data.demand_cube import DemandCube
+from src.data.sales_store import SalesStore
+from .demand_model import DemandForecastingModel, next_model_version, normalize_quantiles, quantile_column
+from .features import DEFAULT_LAGS, DEFAULT_WINDOWS
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_STRATEGIES = ('category', 'volume')
+UNCATEGORIZED = 'Uncategorized'
+
+
+def _fit_segment(segment, data, lags, windows):
+    """Fit one segment model; runs in a worker process"""
+    model = DemandForecastingModel(lags, windows)
+    result = model.train(data)
+    return segment, model, result
+
+
+class SegmentedDemandModel:
+    """Demand model made of one DemandForecastingModel per product segment
+
+    Products are segmented by category (from a product -> category mapping)
+    or into sales-volume quantile clusters. Segment models are fitted in
+    parallel worker processes and each predict call is routed to the model
+    of the product's segment; unseen products go to the largest segment.
+    Workers are spawned rather than forked by default: training runs from a
+    job thread, and a fork could copy a lock another thread holds.
+    """
+
+    def __init__(self, segment_by='volume', n_segments=4, categories=None, max_workers=None,
+                 lags=DEFAULT_LAGS, windows=DEFAULT_WINDOWS, mp_context='spawn'):
+        if segment_by not in SEGMENT_STRATEGIES:
+            raise ValueError(f"segment_by must be one of: {', '.join(SEGMENT_STRATEGIES)}")
+        self.segment_by = segment_by
+        self.n_segments = n_segments
+        self.categories = categories
+        self.max_workers = max_workers
+        self.lags = tuple(lags)
+        self.windows = tuple(windows)
+        self.mp_context = mp_context
+        self.models = {}
+        self.assignments = pd.Series(dtype=object)
+        self.fallback_segment = None
+        self.version = 0
+        self.is_trained = False
+
+    def assign_segments(self, data):
+        """Segment of every product in a sales frame"""
+        if self.segment_by == 'category':
+            products = pd.Index(np.asarray(data['product_id'].dropna().unique(), dtype=object))
+            categories = self.categories if self.categories is not None else pd.Series(dtype=object)
+            segments = pd.Series(np.asarray(products.map(categories), dtype=object), index=products)
+            return segments.fillna(UNCATEGORIZED).astype(str)
+
+        # Volume clusters: quantile bins of mean quantity per product
+        volume = data.groupby('product_id', observed=True)['quantity'].mean()
+        bins = pd.qcut(volume.rank(method='first'), min(self.n_segments, len(volume)), labels=False)
+        products = pd.Index(np.asarray(volume.index, dtype=object))
+        return pd.Series('volume_' + bins.astype(int).astype(str).to_numpy(dtype=object), index=products)
+
+    def train(self, data, progress=None):
+        """Fit one model per segment across a process pool"""
+        progress = progress or (lambda fraction, stage=None: None)
+        if isinstance(data, SalesStore):
+            data = data.frame
+
+        progress(0.05, 'segments')
+        self.assignments = self.assign_segments(data)
+        row_segments = data['product_id'].map(self.assignments).to_numpy()
+        segments = sorted(self.assignments.unique())
+
+        models, results = {}, {}
+        context = multiprocessing.get_context(self.mp_context) if self.mp_context else None
+        with ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context) as pool:
+            futures = [pool.submit(_fit_segment, segment, data[row_segments == segment],
+                                   self.lags, self.windows)
+                       for segment in segments]
+            for done, future in enumerate(as_completed(futures), start=1):
+                segment, model, result = future.result()
+                models[segment], results[segment] = model, result
+                progress(0.1 + 0.9 * done / len(futures), 'fit')
+
+        self.models = models
+        self.fallback_segment = self.assignments.value_counts().idxmax() if len(self.assignments) else None
+        self.version = next_model_version()
+        self.is_trained = True
+
+        return {"status": "trained", "samples": sum(r['samples'] for r in results.values()),
+                "segments": results}
+
+    def update(self, new_rows):
+        """Extend the segment models that own the appended rows"""
+        if not self.is_trained:
+            raise ValueError("Model not trained")
+
+        segments = self._route(new_rows['product_id'])
+        results = {}
+        for segment in pd.unique(segments):
+            results[segment] = self.models[segment].update(new_rows[segments == segment])
+        self.version = next_model_version()
+
+        return {"status": "updated", "samples": sum(m._X.shape[0] for m in self.models.values()),
+                "new_samples": sum(r['new_samples'] for r in results.values()), "segments": results}
+
+    def _route(self, product_ids):
+        """Segment model for each product id, falling back for unseen products"""
+        segments = pd.Series(product_ids).map(self.assignments).fillna(self.fallback_segment)
+        return segments.to_numpy()
+
+    def predict(self, data, days=30, product_ids=None, quantiles=None, start=None):
+        """Forecast every (or the given) product with its segment's model"""
+        if not self.is_trained:
+            raise ValueError("Model not trained")
+
+        # Segment models share lags and windows, so the sales are scanned once for all of them
+        stats = next(iter(self.models.values()))._recent_window_stats(data)
+        if product_ids is None:
+            product_ids = stats[0]
+        product_ids = np.asarray(product_ids)
+
+        segments = self._route(product_ids)
+        quantiles = normalize_quantiles(quantiles)
+        parts = [self.models[segment].predict_from_stats(stats, days, product_ids=product_ids[segments == segment],
+                                                         quantiles=quantiles, start=start)
+                 for segment in pd.unique(segments)]
+        if not parts:
+            return pd.DataFrame(columns=['product_id', 'date', 'predicted_quantity'] +
+                                [quantile_column(quantile) for quantile in quantiles])
+
+        # Restore the requested product order; each product's days stay in date order
+        predictions = pd.concat(parts, ignore_index=True)
+        order = pd.Index(product_ids).get_indexer(predictions['product_id'])
+        return predictions.iloc[np.argsort(order, kind='stable')].reset_index(drop=True)
+
+    def analyze_demand(self, data):
+        """Analyze demand patterns; independent of the segment models"""
+        if isinstance(data, SalesStore):
+            data = data.frame
+        cube = data if isinstance(data, DemandCube) else DemandCube.from_frame(data)
+        return cube.analysis()
+
+    def save_model(self, path):
+        """Save the segment models and product assignments"""
+        joblib.dump({
+            'segment_by': self.segment_by,
+            'n_segments': self.n_segments,
+            'lags': self.lags,
+            'windows': self.windows,
+            'models': self.models,
+            'assignments': self.assignments,
+            'fallback_segment': self.fallback_segment,
+            'is_trained': self.is_trained
+        }, path)
+
+    def load_model(self, path):
+        """Load segment models saved with save_model"""
+        saved_data = joblib.load(path)
+        self.segment_by = saved_data['segment_by']
+        self.n_segments = saved_data['n_segments']
+        self.lags = tuple(saved_data['lags'])
+        self.windows = tuple(saved_data['windows'])
+        self.models = saved_data['models']
+        self.assignments = saved_data['assignments']
+        self.fallback_segment = saved_data['fallback_segment']
+        self.version = next_model_version()
+        self.is_trained = saved_data['is_trained']
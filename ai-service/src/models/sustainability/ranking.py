@@ -0,0 +1,61 @@
+import pandas as pd
+import numpy as np
+
+
+class RankIndex:
+    """Score-sorted positions of one group of products in a score table
+
+    Dense ranks (1 = best) and percentiles match pandas
+    rank(method='dense', ascending=False) and rank(pct=True) within the group.
+    """
+
+    def __init__(self, positions, scores):
+        # Stable sorts keep table order among tied scores, like nlargest/nsmallest
+        order = np.argsort(-scores, kind='stable')
+        self.descending = positions[order]
+        self.ascending = positions[np.argsort(scores, kind='stable')]
+
+        desc_scores = scores[order]
+        self.sorted_scores = desc_scores[::-1]
+        self.dense_ranks = np.concatenate(([1], 1 + np.cumsum(desc_scores[1:] != desc_scores[:-1])))
+        self.percentiles = self.percentile_of(desc_scores)
+
+    def __len__(self):
+        return len(self.descending)
+
+    def percentile_of(self, scores):
+        """Percentile of scores within the group, averaging ties as pandas does"""
+        n = len(self.sorted_scores)
+        below = np.searchsorted(self.sorted_scores, scores, side='left')
+        at_or_below = np.searchsorted(self.sorted_scores, scores, side='right')
+        return (below + (at_or_below - below + 1) / 2) / n * 100
+
+    def page(self, offset=0, limit=None):
+        """Table positions, dense ranks and percentiles of a rank-ordered page"""
+        stop = len(self) if limit is None else offset + limit
+        window = slice(offset, stop)
+        return self.descending[window], self.dense_ranks[window], self.percentiles[window]
+
+    def top(self, k):
+        """Table positions of the k best scores"""
+        return self.descending[:k]
+
+    def bottom(self, k):
+        """Table positions of the k worst scores"""
+        return self.ascending[:k]
+
+
+def build_rank_indexes(table):
+    """Overall (key None) and per-category rank indexes of a scored table"""
+    scores = table['sustainability_score'].to_numpy(dtype=float)
+    indexes = {None: RankIndex(np.arange(len(table)), scores)}
+
+    if 'category' in table.columns:
+        codes, categories = pd.factorize(table['category'])
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(categories) + 1))
+        for i, category in enumerate(categories):
+            positions = order[bounds[i]:bounds[i + 1]]
+            indexes[category] = RankIndex(positions, scores[positions])
+
+    return indexes
@@ -4,13 +4,21 @@ from sklearn.preprocessing import MinMaxScaler
 import joblib
 import logging
 
+from .ranking import build_rank_indexes
+from src.utils.metrics import timed
+
 logger = logging.getLogger(__name__)
 
+# Lower score bounds of Fair, Good and Excellent; anything below is Poor
+LEVEL_BOUNDS = [40, 60, 80]
+LEVELS = np.array(['Poor', 'Fair', 'Good', 'Excellent'])
+
 class SustainabilityModel:
     """Simple sustainability scoring model for products"""
     
     def __init__(self):
-        self.scaler = MinMaxScaler()
+        # Scores outside the fitted reference range saturate at 0 and 1
+        self.scaler = MinMaxScaler(clip=True)
         self.weights = {
             'carbon_footprint': 0.25,
             'recyclability': 0.20,
@@ -19,17 +27,34 @@ class SustainabilityModel:
             'durability': 0.10,
             'end_of_life_score': 0.10
         }
+        self.factors = []
+        self.category_means = None
+        self.global_means = None
+        self.factor_means = None
+        self.score_table = None
+        self._index = None
+        self._rankings = {}
+        self._reference = None
         self.is_trained = False
     
     def prepare_features(self, data):
         """Prepare sustainability features"""
+        with timed('sustainability', 'features', rows=len(data)):
+            return self._prepare_features(data)
+    
+    def _prepare_features(self, data):
         df = data.copy()
         
-        # Fill missing values with category averages
+        # Fill missing values with category averages, taken from the reference once fitted
         for col in self.weights.keys():
             if col in df.columns:
-                df[col] = df[col].fillna(df.groupby('category')[col].transform('mean'))
-                df[col] = df[col].fillna(df[col].mean())
+                if self.is_trained and col in self.factors:
+                    if self.category_means is not None and 'category' in df.columns:
+                        df[col] = df[col].fillna(df['category'].map(self.category_means[col]).astype(float))
+                    df[col] = df[col].fillna(self.global_means[col])
+                else:
+                    df[col] = df[col].fillna(df.groupby('category', observed=True)[col].transform('mean'))
+                    df[col] = df[col].fillna(df[col].mean())
         
         # Normalize carbon footprint (lower is better)
         if 'carbon_footprint' in df.columns:
@@ -37,52 +62,159 @@ class SustainabilityModel:
         
         return df
     
-    def calculate_sustainability_score(self, data):
-        """Calculate sustainability scores for products"""
+    def fit(self, data):
+        """Fit the reference normalization on data and materialize its score table"""
+        self.factors = [factor for factor in self.weights if factor in data.columns]
+        if 'category' in data.columns:
+            self.category_means = data.groupby('category', observed=True)[self.factors].mean()
+        else:
+            self.category_means = None
+        self.global_means = data[self.factors].mean()
+        self.is_trained = True
+        
         df = self.prepare_features(data)
         
-        # Calculate weighted sustainability score
-        score = 0
-        for factor, weight in self.weights.items():
-            if factor in df.columns:
-                # Normalize to 0-1 scale
-                normalized = (df[factor] - df[factor].min()) / (df[factor].max() - df[factor].min())
-                score += normalized * weight
+        # Reference min/max per factor, so a product scores the same in any request
+        with timed('sustainability', 'scale', rows=len(df)):
+            self.scaler.fit(df[self.factors].to_numpy(dtype=float))
+        self.factor_means = df[self.factors].mean()
+        self.score_table = self._score(df).reset_index(drop=True)
+        with timed('sustainability', 'index', rows=len(df)):
+            self._build_indexes()
+        self._reference = data
+        
+        return {"status": "fitted", "products": len(self.score_table)}
+    
+    def calculate_sustainability_score(self, data):
+        """Calculate sustainability scores for products against the fitted reference
+        
+        An unfitted model is first fitted on data, which then becomes the reference.
+        """
+        if not self.is_trained:
+            self.fit(data)
+        if data is self._reference:
+            return self.score_table.copy()
+        
+        return self._score(self.prepare_features(data))
+    
+    def lookup_scores(self, product_ids=None):
+        """Materialized scores of the given products, or of all reference products"""
+        if product_ids is None:
+            return self.score_table
+        positions = self._index.get_indexer_for(product_ids)
+        return self.score_table.take(positions[positions >= 0])
+    
+    def _build_indexes(self):
+        """Product lookup and per-category rank indexes over the score table"""
+        self._index = pd.Index(self.score_table['product_id'])
+        self._rankings = build_rank_indexes(self.score_table)
+        
+        # Per-product rank and percentile, overall and within the product's category
+        size = len(self.score_table)
+        self._overall_ranks = (np.zeros(size, dtype=int), np.zeros(size))
+        self._category_ranks = (np.zeros(size, dtype=int), np.zeros(size))
+        for category, ranking in self._rankings.items():
+            ranks, percentiles = self._overall_ranks if category is None else self._category_ranks
+            ranks[ranking.descending] = ranking.dense_ranks
+            percentiles[ranking.descending] = ranking.percentiles
+    
+    def product_rank(self, product_id):
+        """Rank and percentile of a reference product, overall and in its category"""
+        position = self._index.get_indexer_for([product_id])[0]
+        if position < 0:
+            return None
+        product = self.score_table.iloc[position]
+        
+        result = {
+            'product_id': product_id,
+            'sustainability_score': product['sustainability_score'],
+            'overall_rank': int(self._overall_ranks[0][position]),
+            'overall_percentile': self._overall_ranks[1][position],
+            'total_products': len(self._rankings[None])
+        }
+        if 'category' in self.score_table.columns:
+            category = product['category']
+            result.update({
+                'category': category,
+                'category_rank': int(self._category_ranks[0][position]),
+                'category_percentile': self._category_ranks[1][position],
+                'category_products': len(self._rankings[category])
+            })
+        return result
+    
+    def top_products(self, k=10, category=None, bottom=False):
+        """Best (or worst) k reference products overall or within a category"""
+        ranking = self._rankings.get(category)
+        if ranking is None:
+            return []
+        positions = ranking.bottom(k) if bottom else ranking.top(k)
+        return self.score_table.take(positions)[['product_id', 'sustainability_score']].to_dict('records')
+    
+    def _scored(self, data):
+        """Score table for data, reusing the materialized table for the reference"""
+        if self.is_trained and (data is None or data is self._reference):
+            return self.score_table
+        return self.calculate_sustainability_score(data)
+    
+    def _score(self, df):
+        """Weighted score of prepared features, normalized by the fitted scaler"""
+        with timed('sustainability', 'score', rows=len(df)):
+            return self._weighted_score(df)
+    
+    def _weighted_score(self, df):
+        weights = np.array([self.weights[factor] for factor in self.factors])
+        normalized = self.scaler.transform(df[self.factors].to_numpy(dtype=float))
         
         # Convert to 0-100 scale
-        df['sustainability_score'] = (score * 100).round(2)
+        df['sustainability_score'] = np.round(normalized @ weights * 100, 2)
         
         # Classify sustainability level
-        df['sustainability_level'] = df['sustainability_score'].apply(self._classify_sustainability)
+        df['sustainability_level'] = self._classify_sustainability(df['sustainability_score'].to_numpy())
         
         return df
     
     def _classify_sustainability(self, score):
-        """Classify sustainability based on score"""
-        if score >= 80:
-            return 'Excellent'
-        elif score >= 60:
-            return 'Good'
-        elif score >= 40:
-            return 'Fair'
-        else:
-            return 'Poor'
+        """Classify sustainability based on score, for a single score or an array of scores"""
+        # Missing scores fall through every bound to Poor
+        scores = np.nan_to_num(np.asarray(score, dtype=float), nan=-np.inf)
+        levels = LEVELS[np.digitize(scores, LEVEL_BOUNDS)]
+        return str(levels) if levels.ndim == 0 else levels
+    
+    def score_batch(self, data):
+        """Score arbitrary sustainability records against the fitted reference
+        
+        Factors missing from data are treated as missing values and filled from
+        the reference, so partial records still get a comparable score.
+        """
+        if not self.is_trained:
+            raise ValueError("Sustainability model not fitted")
+        
+        df = data.copy()
+        for factor in self.factors:
+            if factor not in df.columns:
+                df[factor] = np.nan
+        
+        return self._score(self.prepare_features(df))
     
     def analyze_sustainability(self, data):
         """Analyze sustainability patterns"""
-        df = self.calculate_sustainability_score(data)
+        df = self._scored(data)
         
         # Overall statistics
         stats = {
             'avg_score': df['sustainability_score'].mean(),
             'score_distribution': df['sustainability_level'].value_counts().to_dict(),
-            'top_sustainable': df.nlargest(10, 'sustainability_score')[['product_id', 'sustainability_score']].to_dict('records'),
-            'least_sustainable': df.nsmallest(10, 'sustainability_score')[['product_id', 'sustainability_score']].to_dict('records')
         }
+        if df is self.score_table:
+            stats['top_sustainable'] = self.top_products(10)
+            stats['least_sustainable'] = self.top_products(10, bottom=True)
+        else:
+            stats['top_sustainable'] = df.nlargest(10, 'sustainability_score')[['product_id', 'sustainability_score']].to_dict('records')
+            stats['least_sustainable'] = df.nsmallest(10, 'sustainability_score')[['product_id', 'sustainability_score']].to_dict('records')
         
         # Category analysis
         if 'category' in df.columns:
-            category_stats = df.groupby('category')['sustainability_score'].agg(['mean', 'count']).round(2)
+            category_stats = df.groupby('category', observed=True)['sustainability_score'].agg(['mean', 'count']).round(2)
             stats['category_analysis'] = category_stats.to_dict('index')
         
         # Factor analysis
@@ -99,8 +231,13 @@ class SustainabilityModel:
     
     def get_improvement_suggestions(self, data, product_id):
         """Get sustainability improvement suggestions for a product"""
-        df = self.calculate_sustainability_score(data)
-        product_data = df[df['product_id'] == product_id]
+        df = self._scored(data)
+        if df is self.score_table:
+            product_data = self.lookup_scores([product_id])
+            factor_means = self.factor_means
+        else:
+            product_data = df[df['product_id'] == product_id]
+            factor_means = df[self.factors].mean()
         
         if product_data.empty:
             return {"error": "Product not found"}
@@ -112,7 +249,7 @@ class SustainabilityModel:
         for factor, weight in self.weights.items():
             if factor in df.columns:
                 product_score = product[factor]
-                avg_score = df[factor].mean()
+                avg_score = factor_means[factor]
                 
                 if product_score < avg_score:
                     suggestions.append({
@@ -142,24 +279,44 @@ class SustainabilityModel:
         }
         return suggestions.get(factor, 'Improve this sustainability factor')
     
-    def benchmark_products(self, data, category=None):
-        """Benchmark products within category or overall"""
-        df = self.calculate_sustainability_score(data)
+    def benchmark_products(self, data, category=None, offset=0, limit=None):
+        """Benchmark products within category or overall, best first
         
-        if category:
-            df = df[df['category'] == category]
+        offset and limit select a page of the ranking; the rank and percentile
+        of every product are still computed against the whole group.
+        """
+        return self.benchmark_frame(data, category, offset, limit).to_dict('records')
+    
+    def benchmark_frame(self, data, category=None, offset=0, limit=None):
+        """benchmark_products as a frame, for columnar encoding"""
+        columns = ['product_id', 'sustainability_score', 'sustainability_level', 'rank', 'percentile']
+        df = self._scored(data)
+        rankings = self._rankings if df is self.score_table else build_rank_indexes(df)
         
-        # Rank products
-        df['rank'] = df['sustainability_score'].rank(method='dense', ascending=False)
-        df['percentile'] = df['sustainability_score'].rank(pct=True) * 100
+        ranking = rankings.get(category or None)
+        if ranking is None:
+            return pd.DataFrame(columns=columns)
         
-        return df[['product_id', 'sustainability_score', 'sustainability_level', 'rank', 'percentile']].to_dict('records')
+        with timed('sustainability', 'benchmark', rows=len(ranking)):
+            positions, ranks, percentiles = ranking.page(offset, limit)
+            page = df.take(positions)[columns[:3]]
+            return page.assign(rank=ranks, percentile=percentiles)
+    
+    def benchmark_size(self, category=None):
+        """Number of reference products in a benchmark group"""
+        ranking = self._rankings.get(category or None)
+        return len(ranking) if ranking is not None else 0
     
     def save_model(self, path):
         """Save the model configuration"""
         joblib.dump({
             'weights': self.weights,
             'scaler': self.scaler,
+            'factors': self.factors,
+            'category_means': self.category_means,
+            'global_means': self.global_means,
+            'factor_means': self.factor_means,
+            'score_table': self.score_table,
             'is_trained': self.is_trained
         }, path)
     
@@ -168,4 +325,12 @@ class SustainabilityModel:
         saved_data = joblib.load(path)
         self.weights = saved_data['weights']
         self.scaler = saved_data['scaler']
+        self.factors = saved_data.get('factors', [])
+        self.category_means = saved_data.get('category_means')
+        self.global_means = saved_data.get('global_means')
+        self.factor_means = saved_data.get('factor_means')
+        self.score_table = saved_data.get('score_table')
+        if self.score_table is not None:
+            self._build_indexes()
+        self._reference = None
         self.is_trained = saved_data['is_trained']
\ No newline at end of file
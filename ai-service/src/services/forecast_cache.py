@@ -0,0 +1,126 @@
+import pandas as pd
+import numpy as np
+from collections import OrderedDict
+import threading
+import logging
+
+from src.models.demand_forecasting.demand_model import quantile_column
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ROWS = 2_000_000
+
+
+class ForecastCache:
+    """In-process LRU cache of per-product demand forecasts
+
+    Entries are keyed by (model version, product, product data version,
+    quantiles) and hold the longest horizon forecast so far, with one column
+    per quantile; shorter horizons are served as a prefix of it. Size is
+    bounded by the total number of cached forecast rows.
+    """
+
+    def __init__(self, max_rows=DEFAULT_MAX_ROWS):
+        self.max_rows = max_rows
+        self._entries = OrderedDict()
+        self._keys_by_product = {}
+        self._rows = 0
+        self._model_version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def forecast(self, model, store, days, quantiles=()):
+        """Forecast every product in a SalesStore, predicting only products not cached
+
+        quantiles must be normalized (sorted and distinct), so equal requests share entries.
+        """
+        products = store.product_ids
+        quantiles = tuple(quantiles)
+        columns = [quantile_column(quantile) for quantile in quantiles]
+        keys = [(model.version, product_id, version, quantiles)
+                for product_id, version in zip(products, store.product_versions)]
+
+        with self._lock:
+            if self._model_version is None or model.version > self._model_version:
+                # A new model changes every forecast, so nothing cached is reusable. Requests
+                # still holding an older snapshot must not clear the newer model's entries
+                self._clear()
+                self._model_version = model.version
+            entries = [self._lookup(key, days) for key in keys]
+            missing = [i for i, entry in enumerate(entries) if entry is None]
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            fresh = model.predict(store, days=days, product_ids=products[missing], quantiles=quantiles)
+            dates = fresh['date'].to_numpy().reshape(-1, days)
+            values = fresh['predicted_quantity'].to_numpy().reshape(-1, days)
+            bands = fresh[columns].to_numpy(dtype=float).reshape(len(missing), days, len(columns))
+            with self._lock:
+                # Forecasts of a superseded model are served but not cached
+                current = model.version == self._model_version
+                for row, i in enumerate(missing):
+                    entries[i] = (dates[row], values[row], bands[row])
+                    if current:
+                        self._store(keys[i], entries[i])
+
+        predictions = pd.DataFrame({
+            'product_id': np.repeat(products, days),
+            'date': np.concatenate([entry[0][:days] for entry in entries]) if entries else [],
+            'predicted_quantity': np.concatenate([entry[1][:days] for entry in entries]) if entries else []
+        })
+        for j, column in enumerate(columns):
+            predictions[column] = np.concatenate([entry[2][:days, j] for entry in entries]) if entries else []
+        return predictions
+
+    def _lookup(self, key, days):
+        entry = self._entries.get(key)
+        if entry is None or len(entry[0]) < days:
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key, entry):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._rows -= len(old[0])
+        self._entries[key] = entry
+        self._keys_by_product.setdefault(key[1], set()).add(key)
+        self._rows += len(entry[0])
+
+        while self._rows > self.max_rows and self._entries:
+            evicted, (dates, *_) = self._entries.popitem(last=False)
+            self._keys_by_product[evicted[1]].discard(evicted)
+            self._rows -= len(dates)
+
+    def _clear(self):
+        self._entries.clear()
+        self._keys_by_product.clear()
+        self._rows = 0
+
+    def clear(self):
+        """Drop every cached forecast"""
+        with self._lock:
+            self._clear()
+
+    def invalidate_products(self, product_ids):
+        """Drop cached forecasts of products whose sales history changed"""
+        with self._lock:
+            for product_id in product_ids:
+                for key in self._keys_by_product.pop(product_id, ()):
+                    entry = self._entries.pop(key, None)
+                    if entry is not None:
+                        self._rows -= len(entry[0])
+
+    def stats(self):
+        """Cache size and hit counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'rows': self._rows,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None
+            }
@@ -0,0 +1,99 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from datetime import datetime, timezone
+import threading
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+class TrainingScheduler:
+    """Runs training (and other long) jobs on a background worker pool
+
+    A job function is called as fn(report, *args), where report(progress, stage)
+    records progress between 0 and 1. Job records are kept for status queries,
+    the oldest finished ones being dropped beyond max_history.
+    """
+
+    def __init__(self, max_workers=1, max_history=200):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='training')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_history = max_history
+
+    def submit(self, kind, fn, *args):
+        """Queue fn and return the new job record"""
+        job = {
+            'job_id': uuid.uuid4().hex,
+            'kind': kind,
+            'status': 'queued',
+            'progress': 0.0,
+            'stage': None,
+            'submitted_at': _now(),
+            'started_at': None,
+            'finished_at': None,
+            'duration_seconds': None,
+            'result': None,
+            'error': None
+        }
+        with self._lock:
+            self._jobs[job['job_id']] = job
+            self._prune()
+        self._executor.submit(self._run, job['job_id'], fn, args)
+        return dict(job)
+
+    def submit_once(self, kind, fn, *args):
+        """Return the queued or running job of this kind, submitting one if there is none"""
+        with self._lock:
+            for job in reversed(self._jobs.values()):
+                if job['kind'] == kind and job['status'] in ACTIVE_STATUSES:
+                    return dict(job)
+        return self.submit(kind, fn, *args)
+
+    def _run(self, job_id, fn, args):
+        self._update(job_id, status='running', started_at=_now(), stage='started')
+        start = time.perf_counter()
+
+        def report(progress, stage=None):
+            self._update(job_id, progress=round(float(progress), 3), stage=stage)
+
+        try:
+            result = fn(report, *args)
+            self._update(job_id, status='succeeded', progress=1.0, stage='done', result=result)
+        except Exception as e:
+            logger.exception("Job %s failed", job_id)
+            self._update(job_id, status='failed', error=str(e))
+        finally:
+            self._update(job_id, finished_at=_now(),
+                         duration_seconds=round(time.perf_counter() - start, 3))
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job['status'] not in ACTIVE_STATUSES]
+        for job_id in finished[:max(0, len(self._jobs) - self.max_history)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        """Snapshot of a job record, None if unknown"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def jobs(self, kind=None):
+        """Snapshots of all known jobs, newest first"""
+        with self._lock:
+            return [dict(job) for job in reversed(self._jobs.values())
+                    if kind is None or job['kind'] == kind]
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
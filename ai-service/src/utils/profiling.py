@@ -0,0 +1,137 @@
+import os
+import sys
+import threading
+import time
+import logging
+from collections import Counter
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 0.01
+# Frames kept per sampled stack, innermost last
+MAX_DEPTH = 64
+# (file, function) of the loops where threads wait for work; a thread whose
+# innermost frame outside threading/selectors is one of these is idle
+IDLE_WAITS = {
+    ('thread.py', '_worker'),               # ThreadPoolExecutor worker waiting on its queue
+    ('queue.py', 'get'),                    # blocked on a queue
+    ('socketserver.py', 'serve_forever'),   # server waiting for connections
+}
+WAIT_MODULES = ('threading.py', 'selectors.py')
+
+
+def is_idle(frame):
+    """Whether a thread's innermost frame is a wait for new work rather than work"""
+    while frame is not None and os.path.basename(frame.f_code.co_filename) in WAIT_MODULES:
+        frame = frame.f_back
+    return frame is not None and (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_WAITS
+
+
+class SamplingProfiler:
+    """Wall-clock sampling profiler over every thread of the process
+
+    A daemon thread snapshots the stack of every other thread each interval
+    and counts identical stacks, so it can be started and stopped on a live
+    server. Threads idling in a worker pool, queue or accept loop are skipped,
+    so reports show where work runs rather than where threads wait for it. Overhead grows with the number of threads and the sampling rate,
+    not with the work being profiled. Stacks are reported in the collapsed
+    `outer;inner count` format that flame graph tools read.
+    """
+
+    def __init__(self):
+        self._stacks = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.interval = DEFAULT_INTERVAL
+        self.samples = 0
+        self.started_at = None
+        self.stopped_at = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=DEFAULT_INTERVAL, duration=None):
+        """Start sampling, discarding earlier samples; stops by itself after duration seconds"""
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        if duration is not None and duration <= 0:
+            raise ValueError("duration must be positive")
+        with self._lock:
+            if self.running:
+                raise ValueError("Profiler is already running")
+            self._stacks = Counter()
+            self.samples = 0
+            self.interval = interval
+            self.started_at = datetime.now().isoformat()
+            self.stopped_at = None
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(duration,),
+                                            name='sampling-profiler', daemon=True)
+            self._thread.start()
+        logger.info("Sampling profiler started (interval %.4fs)", interval)
+
+    def stop(self):
+        """Stop sampling; samples are kept until the next start"""
+        thread = self._thread
+        if thread is None:
+            return
+        self._stop.set()
+        if thread is not threading.current_thread():
+            thread.join()
+
+    def _run(self, duration):
+        own = threading.get_ident()
+        deadline = None if duration is None else time.monotonic() + duration
+        while not self._stop.wait(self.interval):
+            self._sample(own)
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+        self.stopped_at = datetime.now().isoformat()
+        logger.info("Sampling profiler stopped after %d samples", self.samples)
+
+    def _sample(self, own):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = []
+        for ident, frame in sys._current_frames().items():
+            if ident == own or is_idle(frame):
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_DEPTH:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename}:{frame.f_lineno})')
+                frame = frame.f_back
+            stack.append(names.get(ident, f'thread-{ident}'))
+            stacks.append(';'.join(reversed(stack)))
+        with self._lock:
+            self._stacks.update(stacks)
+            self.samples += 1
+
+    def collapsed(self):
+        """Sampled stacks in collapsed format, most frequent first"""
+        with self._lock:
+            stacks = self._stacks.most_common()
+        return ''.join(f'{stack} {count}\n' for stack, count in stacks)
+
+    def top_functions(self, limit=20):
+        """Functions by the share of samples they were running in (innermost frame)"""
+        with self._lock:
+            stacks = list(self._stacks.items())
+            samples = self.samples
+        own = Counter()
+        for stack, count in stacks:
+            own[stack.rsplit(';', 1)[-1]] += count
+        return [{'function': function, 'samples': count,
+                 'share': round(count / samples, 4) if samples else None}
+                for function, count in own.most_common(limit)]
+
+    def status(self):
+        return {
+            'running': self.running,
+            'interval': self.interval,
+            'samples': self.samples,
+            'started_at': self.started_at,
+            'stopped_at': self.stopped_at
+        }
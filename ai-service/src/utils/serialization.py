@@ -0,0 +1,74 @@
+import pandas as pd
+import numpy as np
+import json
+from json.encoder import encode_basestring_ascii
+
+DEFAULT_CHUNK_ROWS = 50_000
+
+# Response formats by the media type that requests them, the default first
+FORMAT_MIMETYPES = {
+    'application/json': 'records',
+    'application/vnd.columnar+json': 'columnar',
+    'application/x-ndjson': 'ndjson'
+}
+RESPONSE_FORMATS = tuple(FORMAT_MIMETYPES.values())
+
+
+def json_default(value):
+    """json.dumps fallback for NumPy scalars and arrays"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def json_values(values):
+    """JSON text of every element of a 1-d NumPy array"""
+    if not len(values):
+        return []
+    if values.dtype.kind in 'biuf':
+        # Numbers never contain ', ', so one C-level dump can be split per element
+        return json.dumps(values.tolist()).strip('[]').split(', ')
+    if values.dtype.kind == 'M':
+        values = values.astype(str)
+
+    # Encode each distinct value once; ids and levels repeat or are plain strings
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    uniques = np.asarray(uniques, dtype=object)
+    if all(isinstance(value, str) for value in uniques):
+        encoded = list(map(encode_basestring_ascii, uniques))
+    else:
+        encoded = [json.dumps(value, default=str) for value in uniques.tolist()]
+    return np.asarray(encoded, dtype=object)[codes].tolist()
+
+
+def iter_ndjson(frame, columns=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Encode frame as newline-delimited JSON, yielding one text block per chunk of rows"""
+    columns = list(frame.columns) if columns is None else list(columns)
+    keys = [json.dumps(str(col)).replace('%', '%%') for col in columns]
+    template = '{' + ', '.join(f'{key}: %s' for key in keys) + '}\n'
+
+    for start in range(0, len(frame), chunk_rows):
+        chunk = frame.iloc[start:start + chunk_rows]
+        encoded = [json_values(chunk[col].to_numpy()) for col in columns]
+        yield ''.join(template % row for row in zip(*encoded))
+
+
+def iter_columnar_json(frame, columns=None, key='data', envelope=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Encode frame as a JSON object mapping key to one array per column
+
+    envelope fields come first; the column arrays are then yielded in text
+    blocks of at most chunk_rows values, so the body can be streamed.
+    """
+    columns = list(frame.columns) if columns is None else list(columns)
+    head = json.dumps(envelope or {}, default=json_default)[:-1]
+    yield head + (', ' if envelope else '') + json.dumps(key) + ': {'
+
+    for i, col in enumerate(columns):
+        yield (', ' if i else '') + json.dumps(str(col)) + ': ['
+        values = frame[col].to_numpy()
+        for start in range(0, len(values), chunk_rows):
+            yield (', ' if start else '') + ', '.join(json_values(values[start:start + chunk_rows]))
+        yield ']'
+    yield '}}'
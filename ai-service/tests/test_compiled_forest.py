@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.preprocessing import StandardScaler
+
+from src.models.demand_forecasting.compiled_forest import CompiledForest
+
+
+@pytest.fixture(scope='module')
+def fitted():
+    rng = np.random.default_rng(0)
+    # Integer-valued columns put many rows exactly on split thresholds
+    X = np.column_stack([rng.integers(0, 7, 500), rng.integers(1, 13, 500), rng.normal(20, 5, 500)]).astype(float)
+    y = X[:, 0] * 2 + np.sin(X[:, 1]) + rng.normal(0, 1, 500)
+    scaler = StandardScaler().fit(X)
+    forest = RandomForestRegressor(n_estimators=25, random_state=0).fit(scaler.transform(X), y)
+    X_new = np.vstack([X[:100], rng.normal(10, 8, (200, 3)), rng.integers(0, 13, (200, 3))])
+    return scaler, forest, X_new
+
+
+def test_predictions_match_sklearn(fitted):
+    scaler, forest, X = fitted
+    compiled = CompiledForest.from_estimators(scaler, forest)
+
+    np.testing.assert_allclose(compiled.predict(X), forest.predict(scaler.transform(X)), rtol=1e-12, atol=1e-12)
+
+
+def test_tree_predictions_match_each_tree(fitted):
+    scaler, forest, X = fitted
+    compiled = CompiledForest.from_estimators(scaler, forest)
+
+    expected = np.column_stack([tree.predict(scaler.transform(X)) for tree in forest.estimators_])
+    np.testing.assert_array_equal(compiled.tree_predictions(X), expected)
+
+
+def test_round_trip_through_arrays(fitted):
+    scaler, forest, X = fitted
+    compiled = CompiledForest.from_estimators(scaler, forest)
+
+    restored = CompiledForest.from_arrays(compiled.to_arrays())
+    np.testing.assert_array_equal(restored.predict(X), compiled.predict(X))
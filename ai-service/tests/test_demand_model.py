@@ -0,0 +1,25 @@
+import os
+
+import numpy as np
+
+from src.data.ingestion import SALES_SCHEMA, ingest_csv
+from src.data.sales_store import SalesStore
+from src.models.demand_forecasting.demand_model import DemandForecastingModel
+
+SALES_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'sales_data.csv')
+
+
+def test_missing_quantity_only_affects_its_product():
+    sales, _ = ingest_csv(SALES_CSV, SALES_SCHEMA)
+    model = DemandForecastingModel()
+    model.train(sales)
+    clean = model.predict(SalesStore(sales), days=5)
+
+    # Products sort after P006 in the store, so a leaked NaN would reach P007 onwards
+    holed = sales.copy()
+    holed.loc[holed.index[holed['product_id'] == 'P006'][-1], 'quantity'] = np.nan
+    forecast = model.predict(SalesStore(holed), days=5)
+
+    others = clean['product_id'] != 'P006'
+    assert not forecast['predicted_quantity'].isna().any()
+    assert clean[others].equals(forecast[others])
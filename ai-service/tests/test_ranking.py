@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.models.sustainability.ranking import build_rank_indexes
+
+
+@pytest.fixture(scope='module')
+def table():
+    rng = np.random.default_rng(0)
+    # Rounded scores give plenty of ties
+    return pd.DataFrame({
+        'product_id': [f'P{i:03d}' for i in range(300)],
+        'category': rng.choice(['Apparel', 'Home', 'Food'], 300),
+        'sustainability_score': rng.normal(60, 15, 300).round(0)
+    })
+
+
+def test_ranks_and_percentiles_match_pandas(table):
+    indexes = build_rank_indexes(table)
+    groups = {None: table, **{category: group for category, group in table.groupby('category')}}
+
+    for key, group in groups.items():
+        positions, ranks, percentiles = indexes[key].page()
+        scores = table['sustainability_score'].iloc[positions]
+        expected = group['sustainability_score']
+
+        np.testing.assert_array_equal(ranks, expected.rank(method='dense', ascending=False)[scores.index])
+        np.testing.assert_allclose(percentiles, expected.rank(pct=True)[scores.index] * 100)
+
+
+def test_top_and_bottom_match_nlargest_and_nsmallest(table):
+    index = build_rank_indexes(table)[None]
+    scores = table['sustainability_score']
+
+    assert list(index.top(10)) == list(scores.nlargest(10).index)
+    assert list(index.bottom(10)) == list(scores.nsmallest(10).index)
+
+
+def test_page_offsets_into_the_ranking(table):
+    index = build_rank_indexes(table)[None]
+    positions, ranks, _ = index.page()
+
+    page_positions, page_ranks, _ = index.page(offset=5, limit=7)
+    assert list(page_positions) == list(positions[5:12])
+    assert list(page_ranks) == list(ranks[5:12])
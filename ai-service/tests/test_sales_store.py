@@ -0,0 +1,49 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data.ingestion import SALES_SCHEMA, concat_frames, ingest_csv
+from src.data.sales_store import SalesStore
+
+SALES_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'sales_data.csv')
+
+
+def sales():
+    frame, _ = ingest_csv(SALES_CSV, SALES_SCHEMA)
+    return frame
+
+
+def backfill(data):
+    return data.iloc[20:], data.iloc[:20]
+
+
+def same_day_and_missing(data):
+    rows = data.iloc[[3, 3, 50, 7]].copy()
+    rows['quantity'] = [1.0, 2.0, np.nan, 4.0]
+    return data, rows
+
+
+def new_products(data):
+    rows = data.iloc[:4].copy()
+    rows['product_id'] = pd.Categorical(['Z9', 'A0', 'Z9', None])
+    rows['date'] = rows['date'].dt.strftime('%Y-%m-%d')
+    return data, rows
+
+
+@pytest.mark.parametrize('split', [backfill, same_day_and_missing, new_products])
+def test_append_matches_full_rebuild(split):
+    history, new_rows = split(sales())
+    store = SalesStore(history)
+
+    appended = store.append(new_rows)
+    combined = concat_frames([store.frame, new_rows.assign(date=pd.to_datetime(new_rows['date']))])
+    rebuilt = SalesStore(combined, previous=store)
+
+    assert appended.frame.equals(rebuilt.frame)
+    assert list(appended.product_ids) == list(rebuilt.product_ids)
+    for name in ('counts', 'totals', 'valid', 'min_dates', 'max_dates', 'product_versions'):
+        assert np.array_equal(getattr(appended, name), getattr(rebuilt, name)), name
+    assert np.allclose(appended.means, rebuilt.means, equal_nan=True)
+    assert sorted(map(str, appended.changed_products)) == sorted(map(str, rebuilt.changed_products))